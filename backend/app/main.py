@@ -1,19 +1,29 @@
 from __future__ import annotations
 
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
+import asyncio
 import math
 import os
+import time
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 from services.weather import WeatherService
 from services.ai_raison import AiRaisonClient
-from services.routing_ors import ORSRoutingService
+from services.routing_ors import ORSRoutingService, OrsRoute
+from services.routing_local import LocalRoutingService
 from services.poi_fuel import FuelStationService  # ton fichier stations essence
 from services.traffic_tomtom import TomTomTrafficService
+from services.plan_sessions import PlanSession, PlanSessionStore, distance_to_route_m, simplify_line
+from services.deadline import Deadline, DeadlineExceeded
+from services.profiling import Profiler, span
+from services.geocoding import NominatimGeocodingService
+from services.trip_solver import solve_order, unreachable_legs
+from services.context_snapshots import ContextSnapshot, ContextSnapshotStore, request_fingerprint, start_background
 
 load_dotenv()
 
@@ -24,10 +34,62 @@ weather_service = WeatherService()
 ai_raison_client = AiRaisonClient()
 ors_service = ORSRoutingService()
 fuel_service = FuelStationService()
+geocoding_service = NominatimGeocodingService(
+    min_interval_s=float(os.getenv("NOMINATIM_MIN_INTERVAL_S", "1.0")),
+)
+
+# optional in-process engine, only when an OSM extract is configured (loaded at startup, in background)
+local_routing = LocalRoutingService() if os.getenv("LOCAL_GRAPH_PATH") else None
+
+ROUTING_ENGINES = ("ors", "local", "auto")
+ROUTE_PREFERENCES = ("fastest", "shortest", "recommended")
+AVOID_FEATURES = ("highways", "tollways")
+ROUTING_ENGINE = os.getenv("ROUTING_ENGINE", "ors")
+
+# ORS directions accept at most 50 waypoints
+MAX_TRIP_STOPS = int(os.getenv("MAX_TRIP_STOPS", "50"))
 
 LONG_TRIP_KM = float(os.getenv("LONG_TRIP_KM", "60"))
 CITY_TRIP_KM = float(os.getenv("CITY_TRIP_KM", "10"))
 
+# /plan/update thresholds
+UPDATE_OFF_ROUTE_M = float(os.getenv("UPDATE_OFF_ROUTE_M", "75"))
+# sessions keep a decimated route geometry, well within the off-route threshold
+SESSION_GEOMETRY_TOLERANCE_M = float(os.getenv("SESSION_GEOMETRY_TOLERANCE_M", "10"))
+UPDATE_WEATHER_KM = float(os.getenv("UPDATE_WEATHER_KM", "5"))
+UPDATE_WEATHER_TTL_S = float(os.getenv("UPDATE_WEATHER_TTL_S", "900"))
+UPDATE_TRAFFIC_TTL_S = float(os.getenv("UPDATE_TRAFFIC_TTL_S", "180"))
+
+# end-to-end request deadline
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "20"))
+REQUEST_DEADLINE_MAX_S = float(os.getenv("REQUEST_DEADLINE_MAX_S", "60"))
+DEADLINE_RESERVE_S = float(os.getenv("DEADLINE_RESERVE_S", "2"))        # kept for the final routing call
+OPTIONAL_STAGE_MIN_S = float(os.getenv("OPTIONAL_STAGE_MIN_S", "1"))    # below this, weather/traffic/fuel are skipped
+DEADLINE_GRACE_S = 0.5
+DISCONNECT_POLL_S = 0.25
+
+# on-demand request profiling (off unless PROFILE_TOKEN is set; PROFILE_SAMPLE_RATE needs it too)
+PROFILE_HEADER = "X-Profile"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+profiler = Profiler(
+    token=os.getenv("PROFILE_TOKEN") or None,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    capacity=int(os.getenv("PROFILE_BUFFER_SIZE", "20")),
+    interval_s=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000.0,
+)
+if profiler.sample_rate > 0 and not profiler.enabled:
+    print("PROFILING: PROFILE_SAMPLE_RATE is ignored without PROFILE_TOKEN (profiles could not be downloaded)")
+
+plan_sessions = PlanSessionStore(
+    ttl_s=float(os.getenv("PLAN_SESSION_TTL_S", "1800")),
+    max_sessions=int(os.getenv("PLAN_SESSION_MAX", "1000")),
+)
+
+# /context snapshots reused by /plan, with speculative decision + route
+context_snapshots = ContextSnapshotStore(ttl_s=float(os.getenv("CONTEXT_SNAPSHOT_TTL_S", "120")))
+SPECULATE_ON_CONTEXT = os.getenv("SPECULATE_ON_CONTEXT", "1") == "1"
+
 
 class Point(BaseModel):
     lat: float = Field(..., ge=-90, le=90)
@@ -53,10 +115,17 @@ class PlanRequest(BaseModel):
 
     forced_option: Optional[str] = None
 
+    routing_engine: Optional[str] = None  # "ors" | "local" | "auto", defaults to ROUTING_ENGINE
+
+    snapshot_id: Optional[str] = None     # from /context, lets /plan skip re-collection
+
+    track: bool = False                   # keep a session for /plan/update
+
 
 class ContextResponse(BaseModel):
     scenarios: List[str]
     debug: Dict[str, Any] = None
+    snapshot_id: Optional[str] = None
 
 
 class PlanResponse(BaseModel):
@@ -66,6 +135,50 @@ class PlanResponse(BaseModel):
     route: Dict[str, Any]
     ai_raison_raw: Any
     ai_raison_explanations: Dict[str, List[str]] = None
+    session_id: Optional[str] = None
+
+
+class GeocodeItem(BaseModel):
+    display_name: str
+    lat: float
+    lon: float
+
+
+class GeocodeResponse(BaseModel):
+    results: List[GeocodeItem]
+    source: str   # "cache" | "prefix" | "upstream"
+
+
+class TripRequest(BaseModel):
+    stops: List[Point] = Field(..., min_length=2)   # stops[0] is the start
+    round_trip: bool = False
+    keep_last: bool = False                         # stops[-1] is the fixed end
+    preference: str = "fastest"
+    avoid_features: List[str] = []
+    routing_engine: Optional[str] = None
+
+
+class TripResponse(BaseModel):
+    order: List[int]                  # indices into the request stops, in visit order
+    stops: List[Point]
+    matrix_metric: str                # "duration" | "distance" (preference "shortest")
+    # from the matrix, before the final directions call (only the one matching matrix_metric)
+    estimated_duration_s: Optional[float] = None
+    estimated_distance_m: Optional[float] = None
+    route: Dict[str, Any]
+    warnings: List[str] = []
+
+
+class PlanUpdateRequest(BaseModel):
+    session_id: str
+    position: Point
+
+
+class PlanUpdateResponse(PlanResponse):
+    rerouted: bool
+    reroute_reason: Optional[str] = None   # "off_route" | "plan_changed"
+    off_route_m: Optional[float] = None
+    refreshed: List[str] = []              # context parts / decision re-fetched on this update
 
 
 def is_night_now() -> bool:
@@ -179,18 +292,176 @@ def compile_ors_plan(solution_labels: List[str]) -> Dict[str, Any]:
     }
 
 
-async def build_scenarios(req: PlanRequest) -> ContextResponse:
-    scenarios: List[str] = []
-    debug: Dict[str, Any] = {}
+async def compute_route(
+    coords: List[List[float]],
+    preference: str,
+    avoid_features: List[str],
+    engine: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+) -> (OrsRoute, str):
+    """
+    Route with the requested engine:
+      - ors   : remote ORS, local graph as fallback if ORS fails
+      - local : local graph only
+      - auto  : local graph when it covers every point (fast path), ORS otherwise or on failure
+    Returns (route, engine actually used).
+    """
+    engine = (engine or ROUTING_ENGINE).lower()
+
+    async def route_local() -> OrsRoute:
+        call = local_routing.get_route_with_coords(coords, preference, avoid_features)
+        if deadline is None:
+            return await call
+        # the worker thread cannot be interrupted, but the request stops waiting for it
+        return await asyncio.wait_for(call, timeout=deadline.timeout(math.inf))
+
+    if engine == "local":
+        if local_routing is None:
+            raise RuntimeError("local routing engine is not configured (LOCAL_GRAPH_PATH).")
+        return await route_local(), "local"
+
+    if engine == "auto" and local_routing is not None and local_routing.covers(coords):
+        try:
+            return await route_local(), "local"
+        except Exception as e:
+            print("LOCAL ROUTING failed, falling back to ORS:", e)
+
+    try:
+        timeout_s = deadline.timeout(ors_service.timeout_s) if deadline is not None else None
+        route = await ors_service.get_route_with_coords(
+            coords, preference=preference, avoid_features=avoid_features, timeout_s=timeout_s
+        )
+        return route, "ors"
+    except Exception as e:
+        # auto already tried the local graph when it covered the trip; otherwise it
+        # would only snap far-away points onto the extract: keep the ORS error
+        if local_routing is None or engine == "auto" or not local_routing.covers(coords):
+            raise
+        print("ORS routing failed, falling back to local graph:", e)
+        return await route_local(), "local"
+
+
+async def compute_matrix(
+    coords: List[List[float]],
+    metric: str,
+    avoid_features: List[str],
+    engine: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+) -> (List[List[Optional[float]]], str):
+    """
+    Duration or distance matrix with the same engine selection as compute_route.
+    Note: the ORS matrix API ignores avoid_features (only the final route honours them).
+    """
+    engine = (engine or ROUTING_ENGINE).lower()
+
+    async def matrix_local() -> List[List[Optional[float]]]:
+        call = local_routing.get_matrix(coords, metric, avoid_features)
+        if deadline is None:
+            return await call
+        return await asyncio.wait_for(call, timeout=deadline.timeout(math.inf))
+
+    if engine == "local":
+        if local_routing is None:
+            raise RuntimeError("local routing engine is not configured (LOCAL_GRAPH_PATH).")
+        return await matrix_local(), "local"
+
+    if engine == "auto" and local_routing is not None and local_routing.covers(coords):
+        try:
+            return await matrix_local(), "local"
+        except Exception as e:
+            print("LOCAL MATRIX failed, falling back to ORS:", e)
 
-    #weather scenarios
     try:
-        wctx = await weather_service.get_scenarios(req.origin.lat, req.origin.lon)
-        scenarios.extend(wctx.scenarios)
+        timeout_s = deadline.timeout(ors_service.timeout_s, reserve_s=DEADLINE_RESERVE_S) if deadline is not None else None
+        return await ors_service.get_matrix(coords, metric=metric, timeout_s=timeout_s), "ors"
+    except Exception as e:
+        if local_routing is None or engine == "auto" or not local_routing.covers(coords):
+            raise
+        print("ORS matrix failed, falling back to local graph:", e)
+        return await matrix_local(), "local"
+
+
+def upstream_error(what: str, e: Exception, deadline: Optional[Deadline]) -> HTTPException:
+    if isinstance(e, DeadlineExceeded) or (deadline is not None and deadline.expired):
+        return HTTPException(status_code=504, detail=f"request deadline exceeded during {what}")
+    return HTTPException(status_code=502, detail=f"{what} error: {e}")
+
+
+def optional_stage_allowed(deadline: Optional[Deadline]) -> bool:
+    # optional stages must leave room for the decision and the route
+    return deadline is None or deadline.allows(OPTIONAL_STAGE_MIN_S + 2 * DEADLINE_RESERVE_S)
+
+
+async def collect_weather(lat: float, lon: float, deadline: Optional[Deadline] = None) -> (List[str], Dict[str, Any]):
+    debug: Dict[str, Any] = {}
+    if not optional_stage_allowed(deadline):
+        debug["weather_skipped"] = "deadline"
+        return [], debug
+    try:
+        timeout_s = deadline.timeout(weather_service.timeout_s, reserve_s=2 * DEADLINE_RESERVE_S) if deadline else None
+        with span("weather"):
+            wctx = await weather_service.get_scenarios(lat, lon, timeout_s=timeout_s)
         debug["weather_main"] = wctx.raw_main
         debug["weather_scenarios"] = wctx.scenarios
+        return list(wctx.scenarios), debug
     except Exception as e:
         debug["weather_error"] = str(e)
+        return [], debug
+
+
+def traffic_bbox_around(lat: float, lon: float) -> Dict[str, float]:
+    margin = float(os.getenv("TOMTOM_BBOX_MARGIN_DEG", "0.02"))
+    return {"min_lat": lat - margin, "min_lon": lon - margin, "max_lat": lat + margin, "max_lon": lon + margin}
+
+
+async def collect_traffic(lat: float, lon: float, deadline: Optional[Deadline] = None) -> (List[str], Dict[str, Any]):
+    debug: Dict[str, Any] = {}
+    if not optional_stage_allowed(deadline):
+        debug["tomtom_skipped"] = "deadline"
+        return [], debug
+    try:
+        bbox = traffic_bbox_around(lat, lon)
+
+        timeout_s = deadline.timeout(traffic_service.timeout_s, reserve_s=2 * DEADLINE_RESERVE_S) if deadline else None
+        with span("traffic"):
+            tt = await traffic_service.incidents_bbox(**bbox, timeout_s=timeout_s)
+
+        debug["tomtom_bbox"] = bbox
+        debug["tomtom_scenarios"] = tt.scenarios
+        debug["tomtom_error"] = tt.error
+        debug["tomtom_endpoint"] = tt.endpoint
+        if tt.incidents is not None:
+            debug["tomtom_incidents_parsed"] = len(tt.incidents)
+            debug["tomtom_parse_complete"] = tt.complete
+        return list(tt.scenarios), debug
+
+    except Exception as e:
+        debug["tomtom_error"] = str(e)
+        return [], debug
+
+
+def traffic_needed(req: PlanRequest) -> bool:
+    return not req.road_closure and not req.traffic_heavy
+
+
+async def build_scenarios(
+    req: PlanRequest,
+    weather: Optional[Tuple[List[str], Dict[str, Any]]] = None,
+    traffic: Optional[Tuple[List[str], Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+) -> ContextResponse:
+    """
+    weather / traffic: already collected (scenarios, debug) parts to reuse
+    instead of calling the external services again.
+    """
+    scenarios: List[str] = []
+    debug: Dict[str, Any] = {}
+
+    #weather scenarios
+    if weather is None:
+        weather = await collect_weather(req.origin.lat, req.origin.lon, deadline)
+    scenarios.extend(weather[0])
+    debug.update(weather[1])
 
     #time
     if is_night_now():
@@ -240,27 +511,11 @@ async def build_scenarios(req: PlanRequest) -> ContextResponse:
     if req.short_city_trip is True and "short_city_trip" not in scenarios:
         scenarios.append("short_city_trip")
 
-    if not req.road_closure and not req.traffic_heavy:
-        try:
-            margin = float(os.getenv("TOMTOM_BBOX_MARGIN_DEG", "0.02"))
-
-            min_lat = req.origin.lat - margin
-            max_lat = req.origin.lat + margin
-            min_lon = req.origin.lon - margin
-            max_lon = req.origin.lon + margin
-
-            tt = await traffic_service.incidents_bbox(
-                min_lat=min_lat, min_lon=min_lon, max_lat=max_lat, max_lon=max_lon
-            )
-
-            scenarios.extend(tt.scenarios)
-            debug["tomtom_bbox"] = {"min_lat": min_lat, "min_lon": min_lon, "max_lat": max_lat, "max_lon": max_lon}
-            debug["tomtom_scenarios"] = tt.scenarios
-            debug["tomtom_error"] = tt.error
-            debug["tomtom_endpoint"] = tt.endpoint
-
-        except Exception as e:
-            debug["tomtom_error"] = str(e)
+    if traffic_needed(req):
+        if traffic is None:
+            traffic = await collect_traffic(req.origin.lat, req.origin.lon, deadline)
+        scenarios.extend(traffic[0])
+        debug.update(traffic[1])
     else:
         debug["tomtom_skipped"] = True
 
@@ -275,55 +530,47 @@ async def build_scenarios(req: PlanRequest) -> ContextResponse:
     return ContextResponse(scenarios=scenarios_unique, debug=debug)
 
 
-@app.get("/health")
-async def health():
-    return {"ok": True}
-
-
-@app.post("/context", response_model=ContextResponse)
-async def context(req: PlanRequest):
-    return await build_scenarios(req)
-
-
-@app.post("/plan", response_model=PlanResponse)
-async def plan(req: PlanRequest):
-    # scenarios
-    ctx = await build_scenarios(req)
-    scenarios = ctx.scenarios
-
-    if "fuel_critical" in scenarios and "fuel_low" not in scenarios:
-        scenarios.append("fuel_low")
-    if "road_closure" in scenarios and "traffic_heavy" not in scenarios:
-        scenarios.append("traffic_heavy")
-
-    ai_elements: List[str] = []
-
-    # ai-raison decision(s)
+async def decide(
+    req: PlanRequest,
+    scenarios: List[str],
+    deadline: Optional[Deadline] = None,
+) -> (List[str], Any, Dict[str, List[str]], List[str]):
+    """
+    Returns (solution_labels, ai_raw, explanations, ai_elements).
+    """
     if req.forced_option:
-        solution_labels = [req.forced_option]
-        ai_raw: Any = {"forced": True}
-        explanations: Dict[str, List[str]] = {}
-        ai_elements = ["forced_option"]
-    else:
-        try:
-            ai_elements = build_ai_raison_elements_from_scenarios(scenarios)
-            decision = await ai_raison_client.decide(ai_elements)
-            ai_raw = getattr(decision, "raw", decision)
-            solution_labels, explanations = extract_solutions_and_explanations(ai_raw)
-        except Exception as e:
-            raise HTTPException(status_code=502, detail=f"ai-raison error: {e}")
+        return [req.forced_option], {"forced": True}, {}, ["forced_option"]
 
-    print("AI-RAISON elements sent:", ai_elements)
+    try:
+        ai_elements = build_ai_raison_elements_from_scenarios(scenarios)
+        timeout_s = deadline.timeout(ai_raison_client.timeout_s, reserve_s=DEADLINE_RESERVE_S) if deadline else None
+        with span("decision"):
+            decision = await ai_raison_client.decide(ai_elements, timeout_s=timeout_s)
+        ai_raw = getattr(decision, "raw", decision)
+        solution_labels, explanations = extract_solutions_and_explanations(ai_raw)
+    except Exception as e:
+        raise upstream_error("ai-raison", e, deadline)
 
-    # compile ORS plan from multiple solutions
-    plan_cfg = compile_ors_plan(solution_labels)
+    return solution_labels, ai_raw, explanations, ai_elements
 
+
+async def build_route_payload(
+    req: PlanRequest,
+    plan_cfg: Dict[str, Any],
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
     # build coords (with refuel waypoint if needed)
     coords = [[req.origin.lon, req.origin.lat], [req.destination.lon, req.destination.lat]]
     station_used = None
 
-    if plan_cfg["need_refuel"]:
-        stations, fuel_dbg = await fuel_service.find_nearby(req.origin.lat, req.origin.lon, radius_m=4000, limit=5)
+    if plan_cfg["need_refuel"] and deadline is not None and not deadline.allows(OPTIONAL_STAGE_MIN_S + DEADLINE_RESERVE_S):
+        print("REFUEL: skipped, request deadline too close -> direct route")
+    elif plan_cfg["need_refuel"]:
+        budget_s = deadline.remaining() - DEADLINE_RESERVE_S if deadline else None
+        with span("fuel_search"):
+            stations, fuel_dbg = await fuel_service.find_nearby(
+                req.origin.lat, req.origin.lon, radius_m=4000, limit=5, budget_s=budget_s
+            )
         print("FUEL SEARCH DEBUG:", fuel_dbg)
 
         if stations:
@@ -340,24 +587,216 @@ async def plan(req: PlanRequest):
             station_used = None
             print("REFUEL: no station found -> fallback to direct route")
 
-    # ORS route
+    # route (ORS or local graph)
     try:
-        route = await ors_service.get_route_with_coords(
-            coords,
-            preference=plan_cfg["preference"],
-            avoid_features=plan_cfg["avoid_features"],
-        )
+        with span("routing"):
+            route, engine_used = await compute_route(
+                coords,
+                preference=plan_cfg["preference"],
+                avoid_features=plan_cfg["avoid_features"],
+                engine=req.routing_engine,
+                deadline=deadline,
+            )
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"ORS routing error: {e}")
+        raise upstream_error("routing", e, deadline)
 
-    route_payload = {
+    return {
         "distance_m": route.distance_m,
         "duration_s": route.duration_s,
         "geometry": route.geometry,
         "debug_plan": plan_cfg,
         "debug_station": station_used,
+        "debug_engine": engine_used,
     }
 
+
+def add_scenario_implications(scenarios: List[str]) -> List[str]:
+    if "fuel_critical" in scenarios and "fuel_low" not in scenarios:
+        scenarios.append("fuel_low")
+    if "road_closure" in scenarios and "traffic_heavy" not in scenarios:
+        scenarios.append("traffic_heavy")
+    return scenarios
+
+
+@app.on_event("startup")
+async def start_local_routing() -> None:
+    # parsing the extract can take a while: serve ORS-backed requests meanwhile
+    if local_routing is not None:
+        local_routing.start_loading()
+
+
+@app.get("/health")
+async def health():
+    return {"ok": True}
+
+
+def request_deadline(request: Request) -> Deadline:
+    return Deadline.from_header(request.headers.get(DEADLINE_HEADER), REQUEST_DEADLINE_S, REQUEST_DEADLINE_MAX_S)
+
+
+async def run_request(request: Request, deadline: Deadline, coro, response: Optional[Response] = None):
+    """
+    Runs the endpoint work as a task: cancelled as soon as the client
+    disconnects or the deadline (plus a small grace) is over.
+    Profiled when asked by an authorized X-Profile header or sampled.
+    """
+    prof, prof_tokens = None, None
+    if profiler.enabled:
+        reason = profiler.should_profile(request.headers.get(PROFILE_HEADER))
+        if reason is not None:
+            # started before the task so that it inherits the profile context
+            prof, prof_tokens = profiler.start(request.url.path, reason)
+            if response is not None:
+                response.headers["X-Profile-Id"] = prof.profile_id
+
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+            if task in done:
+                try:
+                    return task.result()
+                except DeadlineExceeded:
+                    raise HTTPException(status_code=504, detail="request deadline exceeded")
+            if deadline.overdue(DEADLINE_GRACE_S):
+                raise HTTPException(status_code=504, detail="request deadline exceeded")
+            if await request.is_disconnected():
+                print("CLIENT DISCONNECTED: cancelling request work")
+                raise HTTPException(status_code=499, detail="client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+        if prof is not None:
+            profiler.finish(prof, prof_tokens)
+
+
+def snapshot_fingerprint(req: PlanRequest) -> str:
+    return request_fingerprint(req.model_dump(exclude={"snapshot_id", "track"}))
+
+
+def start_speculation(req: PlanRequest, snap: ContextSnapshot) -> None:
+    """
+    While the user reviews the context, start the likely decision and
+    the likely route (route_fast, or the forced option) in the background.
+    """
+    scenarios = add_scenario_implications(list(snap.scenarios))
+    if not req.forced_option:
+        snap.ai_elements = build_ai_raison_elements_from_scenarios(scenarios)
+        snap.decision_task = start_background(decide(req, scenarios))
+
+    plan_cfg = compile_ors_plan([req.forced_option] if req.forced_option else ["route_fast"])
+    # no speculative Overpass search: refuel plans are routed on demand
+    if not plan_cfg["need_refuel"]:
+        snap.route_plan_cfg = plan_cfg
+        snap.route_task = start_background(build_route_payload(req, plan_cfg))
+
+
+async def await_speculation(task: asyncio.Task, deadline: Optional[Deadline], reserve_s: float = 0.0) -> Any:
+    """
+    Result of a speculative task, or None when it failed, was evicted,
+    or cannot finish within the request budget.
+    """
+    try:
+        if deadline is None:
+            return await asyncio.shield(task)
+        timeout_s = deadline.timeout(math.inf, reserve_s=reserve_s)
+        return await asyncio.wait_for(asyncio.shield(task), timeout=timeout_s)
+    except asyncio.CancelledError:
+        if task.cancelled():
+            return None
+        raise
+    except Exception:
+        return None
+
+
+@app.post("/context", response_model=ContextResponse)
+async def context(req: PlanRequest, request: Request, response: Response):
+    deadline = request_deadline(request)
+    return await run_request(request, deadline, run_context(req, deadline), response)
+
+
+async def run_context(req: PlanRequest, deadline: Optional[Deadline] = None) -> ContextResponse:
+    with span("build_scenarios"):
+        weather = await collect_weather(req.origin.lat, req.origin.lon, deadline)
+        traffic = await collect_traffic(req.origin.lat, req.origin.lon, deadline) if traffic_needed(req) else None
+        ctx = await build_scenarios(req, weather=weather, traffic=traffic)
+
+    snap = ContextSnapshot(
+        fingerprint=snapshot_fingerprint(req),
+        scenarios=list(ctx.scenarios),
+        debug=dict(ctx.debug or {}),
+        weather=weather,
+        traffic=traffic,
+    )
+    valid_engine = not req.routing_engine or req.routing_engine.lower() in ROUTING_ENGINES
+    if SPECULATE_ON_CONTEXT and valid_engine:
+        start_speculation(req, snap)
+    ctx.snapshot_id = context_snapshots.save(snap)
+    return ctx
+
+
+@app.post("/plan", response_model=PlanResponse)
+async def plan(req: PlanRequest, request: Request, response: Response):
+    deadline = request_deadline(request)
+    return await run_request(request, deadline, run_plan(req, deadline), response)
+
+
+async def run_plan(req: PlanRequest, deadline: Optional[Deadline] = None) -> PlanResponse:
+    if req.routing_engine and req.routing_engine.lower() not in ROUTING_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown routing engine: {req.routing_engine}")
+
+    # /context snapshot, only if the request did not change since
+    snap = context_snapshots.get(req.snapshot_id) if req.snapshot_id else None
+    if snap is not None and snap.fingerprint != snapshot_fingerprint(req):
+        snap = None
+    reused: List[str] = []
+
+    # scenarios (parts collected separately so /plan/update can reuse them)
+    with span("build_scenarios"):
+        if snap is not None:
+            weather, traffic = snap.weather, snap.traffic
+            ctx = ContextResponse(scenarios=list(snap.scenarios), debug=dict(snap.debug))
+            reused.append("context")
+        else:
+            weather = await collect_weather(req.origin.lat, req.origin.lon, deadline)
+            traffic = await collect_traffic(req.origin.lat, req.origin.lon, deadline) if traffic_needed(req) else None
+            ctx = await build_scenarios(req, weather=weather, traffic=traffic)
+    scenarios = add_scenario_implications(ctx.scenarios)
+
+    # ai-raison decision(s)
+    decided = None
+    if snap is not None and snap.decision_task is not None:
+        with span("decision_speculative"):
+            decided = await await_speculation(snap.decision_task, deadline, reserve_s=DEADLINE_RESERVE_S)
+    if decided is not None:
+        reused.append("decision")
+    else:
+        decided = await decide(req, scenarios, deadline)
+    solution_labels, ai_raw, explanations, ai_elements = decided
+
+    print("AI-RAISON elements sent:", ai_elements)
+
+    # compile ORS plan from multiple solutions
+    plan_cfg = compile_ors_plan(solution_labels)
+
+    route_payload = None
+    if snap is not None and snap.route_task is not None and plan_cfg == snap.route_plan_cfg:
+        with span("routing_speculative"):
+            speculative = await await_speculation(snap.route_task, deadline)
+        if speculative is not None:
+            route_payload = dict(speculative)
+            reused.append("route")
+    if route_payload is None:
+        route_payload = await build_route_payload(req, plan_cfg, deadline)
+    route_payload["debug_reused"] = reused
+
+    session_id = None
+    if req.track:
+        session_id = save_plan_session(
+            req, scenarios, ai_elements, solution_labels, explanations, ai_raw, plan_cfg,
+            route_payload, weather, traffic,
+        )
+
     return PlanResponse(
         chosen_solutions=solution_labels,
         scenarios=scenarios,
@@ -365,6 +804,268 @@ async def plan(req: PlanRequest):
         route=route_payload,
         ai_raison_raw=ai_raw,
         ai_raison_explanations=explanations,
+        session_id=session_id,
+    )
+
+
+def session_route_payload(route_payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {**route_payload, "geometry": simplify_line(route_payload.get("geometry"), SESSION_GEOMETRY_TOLERANCE_M)}
+
+
+def save_plan_session(
+    req: PlanRequest,
+    scenarios: List[str],
+    ai_elements: List[str],
+    solution_labels: List[str],
+    explanations: Dict[str, List[str]],
+    ai_raw: Any,
+    plan_cfg: Dict[str, Any],
+    route_payload: Dict[str, Any],
+    weather: Tuple[List[str], Dict[str, Any]],
+    traffic: Optional[Tuple[List[str], Dict[str, Any]]],
+) -> str:
+    now = time.monotonic()
+    session = PlanSession(
+        request=req,
+        scenarios=scenarios,
+        ai_elements=ai_elements,
+        solution_labels=solution_labels,
+        explanations=explanations,
+        ai_raw=ai_raw,
+        plan_cfg=plan_cfg,
+        route_payload=session_route_payload(route_payload),
+        weather=weather,
+        weather_pos=(req.origin.lat, req.origin.lon),
+        weather_at=-math.inf if "weather_skipped" in weather[1] else now,
+        traffic=traffic,
+        traffic_bbox=traffic_bbox_around(req.origin.lat, req.origin.lon) if traffic is not None else None,
+        traffic_at=-math.inf if traffic is None or "tomtom_skipped" in traffic[1] else now,
+    )
+    return plan_sessions.save(session)
+
+
+@app.post("/plan/update", response_model=PlanUpdateResponse)
+async def plan_update(upd: PlanUpdateRequest, request: Request, response: Response):
+    deadline = request_deadline(request)
+    return await run_request(request, deadline, run_plan_update(upd, deadline), response)
+
+
+async def run_plan_update(upd: PlanUpdateRequest, deadline: Optional[Deadline] = None) -> PlanUpdateResponse:
+    """
+    Incremental re-planning for a moving vehicle: re-fetch only stale context,
+    re-decide only when ai-raison inputs change, reroute only when off-route
+    or when the compiled route plan changes.
+    """
+    session = plan_sessions.get(upd.session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session_id.")
+
+    pos = upd.position
+    req = session.request.model_copy(update={"origin": pos})
+    now = time.monotonic()
+    refreshed: List[str] = []
+
+    # weather: only when we moved far enough or it got stale
+    moved_km = haversine_km(session.weather_pos[0], session.weather_pos[1], pos.lat, pos.lon)
+    if session.weather is None or moved_km >= UPDATE_WEATHER_KM or now - session.weather_at >= UPDATE_WEATHER_TTL_S:
+        weather = await collect_weather(pos.lat, pos.lon, deadline)
+        if "weather_skipped" not in weather[1]:
+            session.weather = weather
+            session.weather_pos = (pos.lat, pos.lon)
+            session.weather_at = now
+            refreshed.append("weather")
+
+    # traffic: only when we left the last bbox or it got stale
+    if traffic_needed(req):
+        bbox = session.traffic_bbox
+        inside = bbox is not None and bbox["min_lat"] <= pos.lat <= bbox["max_lat"] and bbox["min_lon"] <= pos.lon <= bbox["max_lon"]
+        if session.traffic is None or not inside or now - session.traffic_at >= UPDATE_TRAFFIC_TTL_S:
+            traffic = await collect_traffic(pos.lat, pos.lon, deadline)
+            if "tomtom_skipped" not in traffic[1]:
+                session.traffic = traffic
+                session.traffic_bbox = traffic_bbox_around(pos.lat, pos.lon)
+                session.traffic_at = now
+                refreshed.append("traffic")
+
+    with span("build_scenarios"):
+        ctx = await build_scenarios(req, weather=session.weather, traffic=session.traffic)
+    scenarios = add_scenario_implications(ctx.scenarios)
+
+    # decision: only when its inputs flipped
+    ai_elements = ["forced_option"] if req.forced_option else build_ai_raison_elements_from_scenarios(scenarios)
+    if ai_elements != session.ai_elements:
+        solution_labels, ai_raw, explanations, ai_elements = await decide(req, scenarios, deadline)
+        session.solution_labels = solution_labels
+        session.ai_raw = ai_raw
+        session.explanations = explanations
+        session.ai_elements = ai_elements
+        refreshed.append("decision")
+    session.scenarios = scenarios
+
+    # route: only when off-route or the route plan changed
+    off_route_m = distance_to_route_m(pos.lat, pos.lon, session.route_payload.get("geometry"))
+    plan_cfg = compile_ors_plan(session.solution_labels)
+
+    reason = None
+    if plan_cfg != session.plan_cfg:
+        reason = "plan_changed"
+    elif off_route_m > UPDATE_OFF_ROUTE_M:
+        reason = "off_route"
+
+    # the session only keeps a decimated geometry: full geometry is returned on reroute only
+    route_payload = session.route_payload
+    if reason is not None:
+        route_payload = await build_route_payload(req, plan_cfg, deadline)
+        session.route_payload = session_route_payload(route_payload)
+        session.plan_cfg = plan_cfg
+
+    plan_sessions.save(session)
+
+    return PlanUpdateResponse(
+        chosen_solutions=session.solution_labels,
+        scenarios=scenarios,
+        ai_raison_elements=session.ai_elements,
+        route=route_payload,
+        ai_raison_raw=session.ai_raw,
+        ai_raison_explanations=session.explanations,
+        session_id=session.session_id,
+        rerouted=reason is not None,
+        reroute_reason=reason,
+        off_route_m=off_route_m if off_route_m != math.inf else None,
+        refreshed=refreshed,
+    )
+
+
+@app.get("/geocode", response_model=GeocodeResponse)
+async def geocode(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(5, ge=1, le=10),
+):
+    deadline = request_deadline(request)
+    return await run_request(request, deadline, run_geocode(q, limit, deadline))
+
+
+async def run_geocode(q: str, limit: int, deadline: Optional[Deadline] = None) -> GeocodeResponse:
+    try:
+        timeout_s = deadline.timeout(geocoding_service.timeout_s) if deadline else None
+        results, source = await geocoding_service.search(q, limit=limit, timeout_s=timeout_s)
+    except Exception as e:
+        raise upstream_error("geocoding", e, deadline)
+
+    return GeocodeResponse(
+        results=[GeocodeItem(display_name=r.display_name, lat=r.lat, lon=r.lon) for r in results],
+        source=source,
+    )
+
+
+@app.post("/trip/optimize", response_model=TripResponse)
+async def trip_optimize(trip: TripRequest, request: Request, response: Response):
+    deadline = request_deadline(request)
+    return await run_request(request, deadline, run_trip_optimize(trip, deadline), response)
+
+
+async def run_trip_optimize(trip: TripRequest, deadline: Optional[Deadline] = None) -> TripResponse:
+    """
+    Multi-stop trip: one duration (or distance) matrix, local stop ordering
+    (nearest neighbour + 2-opt / or-opt), then one directions call.
+    """
+    max_stops = MAX_TRIP_STOPS - 1 if trip.round_trip else MAX_TRIP_STOPS
+    if len(trip.stops) > max_stops:
+        raise HTTPException(status_code=400, detail=f"Too many stops (max {max_stops}).")
+    if trip.routing_engine and trip.routing_engine.lower() not in ROUTING_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown routing engine: {trip.routing_engine}")
+    if trip.preference not in ROUTE_PREFERENCES:
+        raise HTTPException(status_code=400, detail=f"Unknown preference: {trip.preference}")
+    unknown = [f for f in trip.avoid_features if f not in AVOID_FEATURES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown avoid_features: {', '.join(unknown)}")
+
+    coords = [[p.lon, p.lat] for p in trip.stops]
+    metric = "distance" if trip.preference == "shortest" else "duration"
+
+    try:
+        with span("trip_matrix"):
+            matrix, matrix_engine = await compute_matrix(
+                coords, metric, trip.avoid_features, engine=trip.routing_engine, deadline=deadline
+            )
+    except Exception as e:
+        raise upstream_error("matrix", e, deadline)
+
+    warnings: List[str] = []
+    if trip.avoid_features and matrix_engine == "ors":
+        warnings.append(
+            "avoid_features are not applied to the ORS matrix: the stop order ignores them, the final route honours them."
+        )
+
+    with span("trip_solve"):
+        end = len(coords) - 1 if trip.keep_last and not trip.round_trip else None
+        order, estimated = solve_order(matrix, start=0, end=end, round_trip=trip.round_trip)
+
+    # the solver prices unreachable pairs with a placeholder cost: never report it as an estimate
+    unreachable = unreachable_legs(matrix, order + [order[0]] if trip.round_trip else order)
+    if unreachable:
+        estimated = None
+        legs = ", ".join(f"{a}->{b}" for a, b in unreachable)
+        warnings.append(
+            f"No {metric} in the matrix for legs {legs} (stop indices): the estimate is omitted and the order may be suboptimal."
+        )
+
+    ordered = [coords[i] for i in order]
+    if trip.round_trip:
+        ordered.append(coords[order[0]])
+
+    try:
+        with span("routing"):
+            route, engine_used = await compute_route(
+                ordered,
+                preference=trip.preference,
+                avoid_features=trip.avoid_features,
+                engine=trip.routing_engine,
+                deadline=deadline,
+            )
+    except Exception as e:
+        raise upstream_error("routing", e, deadline)
+
+    return TripResponse(
+        order=order,
+        stops=[trip.stops[i] for i in order],
+        matrix_metric=metric,
+        estimated_duration_s=estimated if metric == "duration" else None,
+        estimated_distance_m=estimated if metric == "distance" else None,
+        route={
+            "distance_m": route.distance_m,
+            "duration_s": route.duration_s,
+            "geometry": route.geometry,
+            "debug_engine": engine_used,
+            "debug_matrix_engine": matrix_engine,
+        },
+        warnings=warnings,
+    )
+
+
+def require_profile_admin(request: Request) -> None:
+    if not profiler.token:
+        raise HTTPException(status_code=404, detail="Profiling admin is disabled (PROFILE_TOKEN).")
+    if not profiler.authorized(request.headers.get(ADMIN_TOKEN_HEADER)):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+@app.get("/admin/profiles")
+async def admin_profiles(request: Request):
+    require_profile_admin(request)
+    return {"profiles": profiler.list()}
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_profile(profile_id: str, request: Request):
+    require_profile_admin(request)
+    data = profiler.export(profile_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Unknown profile_id (may have left the ring buffer).")
+    return JSONResponse(
+        data,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.json"'},
     )
 
 
@@ -81,10 +81,16 @@ class AiRaisonClient:
 
         return {"elements": elements, "options": options}
 
-    async def decide(self, element_labels: List[str], option_labels: Optional[List[str]] = None) -> AiRaisonResult:
+    async def decide(
+        self,
+        element_labels: List[str],
+        option_labels: Optional[List[str]] = None,
+        timeout_s: Optional[float] = None,
+    ) -> AiRaisonResult:
         """
         Calls: POST https://api.ai-raison.com/executions/<PROJECT_ID>/latest
         with header x-api-key
+        timeout_s: overrides the default timeout (ex: remaining request budget).
         """
         project_id = os.getenv("AI_RAISON_PROJECT_ID")
         if not project_id:
@@ -99,7 +105,7 @@ class AiRaisonClient:
 
         payload = self._build_payload(element_labels, option_labels)
 
-        async with httpx.AsyncClient(timeout=self.timeout_s) as client:
+        async with httpx.AsyncClient(timeout=timeout_s if timeout_s is not None else self.timeout_s) as client:
             r = await client.post(url, headers=headers, json=payload)
             r.raise_for_status()
             data = r.json()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import hashlib
+import json
+import time
+import uuid
+
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    """
+    Stable hash of a request body, used to check that a /plan matches the /context snapshot.
+    """
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def start_background(coro) -> asyncio.Task:
+    """
+    Starts a task detached from the caller's context (profile, spans),
+    and marks its exception as retrieved so failed speculation stays silent.
+    """
+    task = contextvars.Context().run(asyncio.ensure_future, coro)
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+
+@dataclass
+class ContextSnapshot:
+    """
+    Context collected by /context, plus speculative work started for the /plan that usually follows.
+    """
+    fingerprint: str
+    scenarios: List[str]
+    debug: Dict[str, Any]
+    weather: Optional[Tuple[List[str], Dict[str, Any]]] = None
+    traffic: Optional[Tuple[List[str], Dict[str, Any]]] = None
+
+    ai_elements: Optional[List[str]] = None
+    decision_task: Optional[asyncio.Task] = None
+    route_plan_cfg: Optional[Dict[str, Any]] = None
+    route_task: Optional[asyncio.Task] = None
+
+    snapshot_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: float = field(default_factory=time.monotonic)
+
+    def cancel(self) -> None:
+        for task in (self.decision_task, self.route_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+class ContextSnapshotStore:
+    """
+    Short-lived in-memory snapshots; pending speculation is cancelled on eviction.
+    """
+
+    def __init__(self, ttl_s: float = 120.0, max_snapshots: int = 1000):
+        self.ttl_s = ttl_s
+        self.max_snapshots = max_snapshots
+        self._snapshots: Dict[str, ContextSnapshot] = {}
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        expired = [sid for sid, s in self._snapshots.items() if now - s.created_at > self.ttl_s]
+        for sid in expired:
+            self._snapshots.pop(sid).cancel()
+
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.pop(next(iter(self._snapshots))).cancel()
+
+    def get(self, snapshot_id: str) -> Optional[ContextSnapshot]:
+        self._prune()
+        return self._snapshots.get(snapshot_id)
+
+    def save(self, snapshot: ContextSnapshot) -> str:
+        self._snapshots[snapshot.snapshot_id] = snapshot
+        self._prune()
+        return snapshot.snapshot_id
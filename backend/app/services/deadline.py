@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from typing import Optional
+import math
+import time
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class Deadline:
+    """
+    End-to-end time budget of one request.
+    Each downstream call gets min(its own timeout, what is left of the budget).
+    """
+
+    def __init__(self, budget_s: float):
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default_s: float, max_s: Optional[float] = None) -> "Deadline":
+        """
+        value: remaining budget in milliseconds (ex: X-Request-Deadline-Ms header).
+        Invalid, non-finite (nan, inf) or missing values fall back to default_s.
+        """
+        budget_s = default_s
+        if value:
+            try:
+                parsed = float(value)
+            except ValueError:
+                parsed = math.nan
+            if math.isfinite(parsed):
+                budget_s = parsed / 1000.0
+        if max_s is not None:
+            budget_s = min(budget_s, max_s)
+        return cls(max(budget_s, 0.0))
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def allows(self, min_s: float) -> bool:
+        # used to skip optional stages when the budget runs low
+        return self.remaining() >= min_s
+
+    def overdue(self, grace_s: float) -> bool:
+        return time.monotonic() > self.expires_at + grace_s
+
+    def timeout(self, cap_s: float, reserve_s: float = 0.0) -> float:
+        """
+        Timeout for one downstream call, keeping reserve_s for the stages after it.
+        """
+        left = self.remaining() - reserve_s
+        if left <= 0.0:
+            raise DeadlineExceeded("request deadline exceeded")
+        return min(cap_s, left)
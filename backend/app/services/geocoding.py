@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import re
+import time
+import unicodedata
+import httpx
+
+
+@dataclass(frozen=True)
+class GeocodeResult:
+    display_name: str
+    lat: float
+    lon: float
+
+
+def normalize_query(q: str) -> str:
+    """
+    Lowercase, strip accents and punctuation, collapse spaces:
+    "  Gare de Lyon, PARIS " -> "gare de lyon paris"
+    """
+    text = unicodedata.normalize("NFKD", q)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w]+", " ", text.lower())
+    return " ".join(text.split())
+
+
+def _name_tokens(display_name: str) -> List[str]:
+    """
+    Normalized tokens of the leading name part of a display_name, without the
+    city/region/country parts: "4, Rue de Rivoli, Paris, France" -> ["4", "rue", "de", "rivoli"].
+    """
+    parts = display_name.split(",")
+    lead = parts[0]
+    # addresses start with the house number alone
+    if len(parts) > 1 and normalize_query(lead).replace(" ", "").isdigit():
+        lead = f"{lead} {parts[1]}"
+    return normalize_query(lead).split()
+
+
+class NominatimGeocodingService:
+    """
+    Geocoding proxy in front of Nominatim (OpenStreetMap):
+      - normalized-query cache (LRU + TTL)
+      - autocomplete answered locally by filtering the results of a cached shorter query
+      - concurrent identical queries share one upstream call
+      - upstream calls spaced by min_interval_s (Nominatim policy: 1 req/s)
+    """
+
+    PREFIX_LEN = 3
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        timeout_s: float = 8.0,
+        cache_ttl_s: float = 24 * 3600.0,
+        cache_size: int = 5000,
+        min_interval_s: float = 1.0,
+    ):
+        self.base_url = base_url or os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org")
+        self.user_agent = user_agent or os.getenv("NOMINATIM_USER_AGENT", "RouteRaison/0.2 (geocoding proxy)")
+        self.timeout_s = timeout_s
+        self.cache_ttl_s = cache_ttl_s
+        self.cache_size = cache_size
+        self.min_interval_s = min_interval_s
+
+        # normalized query -> (fetched at, requested limit, results)
+        self._cache: "OrderedDict[str, Tuple[float, int, List[GeocodeResult]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+
+        self._rate_lock = asyncio.Lock()
+        self._last_upstream = 0.0
+
+    def _cache_entry(self, norm: str) -> Optional[Tuple[int, List[GeocodeResult]]]:
+        hit = self._cache.get(norm)
+        if hit is None:
+            return None
+        at, limit, results = hit
+        if time.monotonic() - at > self.cache_ttl_s:
+            del self._cache[norm]
+            return None
+        self._cache.move_to_end(norm)
+        return limit, results
+
+    def _cache_get(self, norm: str, limit: int) -> Optional[List[GeocodeResult]]:
+        entry = self._cache_entry(norm)
+        if entry is None:
+            return None
+        cached_limit, results = entry
+        # a page fetched with a larger limit, or a short (exhaustive) page, answers smaller limits
+        if cached_limit >= limit or len(results) < cached_limit:
+            return results[:limit]
+        return None
+
+    def _cache_put(self, norm: str, limit: int, results: List[GeocodeResult]) -> None:
+        entry = self._cache_entry(norm)
+        if entry is not None and entry[0] > limit:
+            # keep the larger page
+            return
+        self._cache[norm] = (time.monotonic(), limit, results)
+        self._cache.move_to_end(norm)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _prefix_lookup(self, norm: str, limit: int) -> Optional[List[GeocodeResult]]:
+        """
+        Autocomplete: when the query extends a cached shorter query ("rue de ri" ->
+        "rue de rivoli"), filters that query's results on their leading name part.
+        Answers only with a full page, or from an exhaustive (short) cached page.
+        """
+        tokens = norm.split()
+        for k in range(len(norm) - 1, self.PREFIX_LEN - 1, -1):
+            entry = self._cache_entry(norm[:k])
+            if entry is None:
+                continue
+            cached_limit, results = entry
+            matches: List[GeocodeResult] = []
+            for res in results:
+                name_tokens = _name_tokens(res.display_name)
+                if all(any(nt.startswith(t) for nt in name_tokens) for t in tokens):
+                    matches.append(res)
+            if len(matches) >= limit or (matches and len(results) < cached_limit):
+                return matches[:limit]
+            # the longest cached prefix is the most specific one: do not look further
+            return None
+        return None
+
+    async def _fetch(self, q: str, limit: int, timeout_s: float) -> List[GeocodeResult]:
+        # space upstream calls out; waiting counts against the caller's timeout
+        started = time.monotonic()
+        async with self._rate_lock:
+            # time spent queued on the lock is already gone from the budget
+            remaining = timeout_s - (time.monotonic() - started)
+            wait_s = self._last_upstream + self.min_interval_s - time.monotonic()
+            if wait_s >= remaining:
+                raise RuntimeError("Nominatim rate limit: no upstream slot within timeout.")
+            if wait_s > 0:
+                await asyncio.sleep(wait_s)
+            left = timeout_s - (time.monotonic() - started)
+            if left <= 0:
+                raise RuntimeError("Nominatim rate limit: no upstream slot within timeout.")
+            self._last_upstream = time.monotonic()
+
+        params = {"format": "json", "q": q, "limit": str(limit)}
+        headers = {"Accept": "application/json", "User-Agent": self.user_agent}
+
+        async with httpx.AsyncClient(timeout=left) as client:
+            r = await client.get(f"{self.base_url}/search", params=params, headers=headers)
+            r.raise_for_status()
+            data = r.json()
+
+        results: List[GeocodeResult] = []
+        for item in data if isinstance(data, list) else []:
+            try:
+                results.append(GeocodeResult(
+                    display_name=item.get("display_name") or "",
+                    lat=float(item["lat"]),
+                    lon=float(item["lon"]),
+                ))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return results
+
+    async def search(self, q: str, limit: int = 5, timeout_s: Optional[float] = None) -> Tuple[List[GeocodeResult], str]:
+        """
+        Returns (results, source) with source in "cache" | "prefix" | "upstream".
+        """
+        norm = normalize_query(q)
+        if not norm:
+            return [], "cache"
+        key = (norm, limit)
+
+        cached = self._cache_get(norm, limit)
+        if cached is not None:
+            return cached, "cache"
+
+        local = self._prefix_lookup(norm, limit)
+        if local is not None:
+            return local, "prefix"
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(q.strip(), limit, timeout_s or self.timeout_s))
+            self._inflight[key] = task
+
+            def done(t: asyncio.Task) -> None:
+                self._inflight.pop(key, None)
+                if not t.cancelled() and t.exception() is None:
+                    self._cache_put(norm, limit, t.result())
+
+            task.add_done_callback(done)
+
+        # shield: a waiter giving up must not cancel the call shared with other waiters
+        return await asyncio.shield(task), "upstream"
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import math
+import time
+import uuid
+
+
+@dataclass
+class PlanSession:
+    """
+    State kept between /plan and /plan/update for one moving vehicle.
+    """
+    request: Any                        # original PlanRequest
+    scenarios: List[str]
+    ai_elements: List[str]
+    solution_labels: List[str]
+    explanations: Dict[str, List[str]]
+    ai_raw: Any
+    plan_cfg: Dict[str, Any]
+    route_payload: Dict[str, Any]
+
+    # context parts, with where/when they were fetched (-inf: never, always stale)
+    weather: Optional[Tuple[List[str], Dict[str, Any]]] = None
+    weather_pos: Optional[Tuple[float, float]] = None
+    weather_at: float = -math.inf
+    traffic: Optional[Tuple[List[str], Dict[str, Any]]] = None
+    traffic_bbox: Optional[Dict[str, float]] = None
+    traffic_at: float = -math.inf
+
+    session_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    updated_at: float = field(default_factory=time.monotonic)
+
+
+class PlanSessionStore:
+    """
+    In-memory session store with idle TTL and a size cap (oldest evicted first).
+    """
+
+    def __init__(self, ttl_s: float = 1800.0, max_sessions: int = 1000):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, PlanSession] = {}
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        expired = [sid for sid, s in self._sessions.items() if now - s.updated_at > self.ttl_s]
+        for sid in expired:
+            del self._sessions[sid]
+
+        # dicts keep insertion order and save() re-inserts, so the first keys are the idlest
+        while len(self._sessions) > self.max_sessions:
+            del self._sessions[next(iter(self._sessions))]
+
+    def get(self, session_id: str) -> Optional[PlanSession]:
+        self._prune()
+        return self._sessions.get(session_id)
+
+    def save(self, session: PlanSession) -> str:
+        session.updated_at = time.monotonic()
+        self._sessions.pop(session.session_id, None)
+        self._sessions[session.session_id] = session
+        self._prune()
+        return session.session_id
+
+
+def simplify_line(geometry: Any, tolerance_m: float) -> Any:
+    """
+    Douglas-Peucker decimation of a GeoJSON LineString: every dropped point
+    stays within tolerance_m of the kept line. Other geometries are returned as-is.
+    """
+    coords = (geometry or {}).get("coordinates") or []
+    if len(coords) < 3 or tolerance_m <= 0:
+        return geometry
+
+    R = 6371000.0
+    lat0 = coords[0][1]
+    k_lon = math.cos(math.radians(lat0)) * R * math.pi / 180.0
+    k_lat = R * math.pi / 180.0
+    pts = [((c[0] - coords[0][0]) * k_lon, (c[1] - lat0) * k_lat) for c in coords]
+
+    keep = bytearray(len(pts))
+    keep[0] = keep[-1] = 1
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        a, b = stack.pop()
+        ax, ay = pts[a]
+        dx, dy = pts[b][0] - ax, pts[b][1] - ay
+        seg2 = dx * dx + dy * dy
+        far, far_d = -1, tolerance_m
+        for i in range(a + 1, b):
+            x, y = pts[i][0] - ax, pts[i][1] - ay
+            t = 0.0 if seg2 == 0 else max(0.0, min(1.0, (x * dx + y * dy) / seg2))
+            d = math.hypot(x - t * dx, y - t * dy)
+            if d > far_d:
+                far, far_d = i, d
+        if far >= 0:
+            keep[far] = 1
+            stack.append((a, far))
+            stack.append((far, b))
+
+    return {**geometry, "coordinates": [c for c, k in zip(coords, keep) if k]}
+
+
+def distance_to_route_m(lat: float, lon: float, geometry: Any) -> float:
+    """
+    Distance from a point to a GeoJSON LineString, using a local
+    equirectangular projection (accurate enough at on/off-route scale).
+    """
+    coords = (geometry or {}).get("coordinates") or []
+    if not coords:
+        return math.inf
+
+    R = 6371000.0
+    k_lon = math.cos(math.radians(lat)) * R * math.pi / 180.0
+    k_lat = R * math.pi / 180.0
+
+    best = math.inf
+    px, py = 0.0, 0.0
+    prev: Optional[Tuple[float, float]] = None
+    for c in coords:
+        x = (c[0] - lon) * k_lon
+        y = (c[1] - lat) * k_lat
+        if prev is None:
+            d = math.hypot(x, y)
+        else:
+            ax, ay = prev
+            dx, dy = x - ax, y - ay
+            seg2 = dx * dx + dy * dy
+            t = 0.0 if seg2 == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / seg2))
+            d = math.hypot(ax + t * dx - px, ay + t * dy - py)
+        if d < best:
+            best = d
+        prev = (x, y)
+    return best
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from typing import List, Optional, Tuple
+import time
 import httpx
 
 
@@ -68,10 +69,12 @@ class FuelStationService:
         lat: float,
         lon: float,
         radius_m: int = 2000,
-        limit: int = 5
+        limit: int = 5,
+        budget_s: Optional[float] = None,
     ) -> Tuple[List[FuelStation], FuelSearchDebug]:
         """
         Returns (stations, debug).
+        budget_s: total time allowed across all endpoint attempts (None = no limit).
         """
         query = self._build_query(lat, lon, radius_m, limit)
 
@@ -81,10 +84,19 @@ class FuelStationService:
         endpoints.extend(self.OVERPASS_ENDPOINTS)
 
         last_err: Optional[str] = None
+        started = time.monotonic()
 
         for endpoint in endpoints:
+            timeout_s = self.timeout_s
+            if budget_s is not None:
+                left = budget_s - (time.monotonic() - started)
+                if left <= 0:
+                    last_err = last_err or "budget exhausted"
+                    break
+                timeout_s = min(timeout_s, left)
+
             try:
-                async with httpx.AsyncClient(timeout=self.timeout_s) as client:
+                async with httpx.AsyncClient(timeout=timeout_s) as client:
                     r = await client.post(endpoint, data=query)
                     r.raise_for_status()
                     data = r.json()
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+from collections import Counter, deque
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Set, Tuple
+import contextlib
+import hmac
+import random
+import sys
+import threading
+import time
+import uuid
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List[Span] = []
+
+    def to_dict(self, t0: float) -> Dict[str, Any]:
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - t0) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "children": [c.to_dict(t0) for c in self.children],
+        }
+
+
+class RequestProfile:
+    """
+    One captured request: span tree (async-aware through contextvars)
+    plus CPU stack samples taken while the request was running.
+    Stack samples cover the whole process (the event loop thread is shared):
+    when other profiled requests ran during sampling, their ids are listed in
+    `overlapping` and the CPU stacks also contain their work.
+    """
+
+    def __init__(self, name: str, reason: str):
+        self.profile_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.reason = reason                # "header" | "sampled"
+        self.started_at = time.time()
+        self.root = Span(name)
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.overlapping: Set[str] = set()
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.root.end if self.root.end is not None else time.perf_counter()
+        return {
+            "profile_id": self.profile_id,
+            "name": self.name,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": round((end - self.root.start) * 1000, 3),
+            "cpu_samples": self.sample_count,   # sampling ticks, each covering every thread
+            "contaminated": bool(self.overlapping),
+            "overlapping_profiles": sorted(self.overlapping),
+        }
+
+    def to_dict(self, top: int = 50) -> Dict[str, Any]:
+        out = self.summary()
+        out["spans"] = self.root.to_dict(self.root.start)
+        out["cpu_stacks"] = [
+            {"count": n, "stack": list(stack)} for stack, n in self.samples.most_common(top)
+        ]
+        return out
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+_NOOP = contextlib.nullcontext()
+
+IDLE_FRAME_FILES = ("threading.py", "selectors.py", "queue.py")
+
+
+class _SpanContext:
+    __slots__ = ("span", "token")
+
+    def __init__(self, name: str):
+        self.span = Span(name)
+        self.token = None
+
+    def __enter__(self) -> Span:
+        parent = _current_span.get()
+        if parent is not None:
+            parent.children.append(self.span)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, *exc) -> None:
+        self.span.end = time.perf_counter()
+        _current_span.reset(self.token)
+
+
+def span(name: str):
+    """
+    `with span("decision"):` records a timed child span of the current one.
+    No-op (shared null context) when the request is not being profiled.
+    """
+    if _current_profile.get() is None:
+        return _NOOP
+    return _SpanContext(name)
+
+
+class _StackSampler(threading.Thread):
+    """
+    Samples the Python stacks of all other threads at a fixed interval and
+    adds them to every active profile. Only runs while profiles are active.
+    """
+
+    def __init__(self, profiler: "Profiler"):
+        super().__init__(name="request-profiler", daemon=True)
+        self.profiler = profiler
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            active = self.profiler._active_snapshot()
+            if not active:
+                return
+            names = {t.ident: t.name for t in threading.enumerate()}
+            keys = []
+            for ident, frame in sys._current_frames().items():
+                # skip ourselves and threads blocked waiting for work
+                if ident == own or frame.f_code.co_filename.endswith(IDLE_FRAME_FILES):
+                    continue
+                stack = []
+                f = frame
+                while f is not None and len(stack) < self.profiler.max_depth:
+                    code = f.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{f.f_lineno}")
+                    f = f.f_back
+                keys.append((names.get(ident, str(ident)),) + tuple(reversed(stack)))
+            with self.profiler._lock:
+                for prof in active:
+                    for key in keys:
+                        prof.samples[key] += 1
+                    prof.sample_count += 1
+                    if len(active) > 1:
+                        prof.overlapping.update(p.profile_id for p in active if p is not prof)
+            time.sleep(self.profiler.interval_s)
+
+
+class Profiler:
+    """
+    Opt-in per-request profiling with the last `capacity` profiles kept
+    in an in-memory ring buffer.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        capacity: int = 20,
+        interval_s: float = 0.005,
+        max_depth: int = 40,
+    ):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval_s = interval_s
+        self.max_depth = max_depth
+        self.profiles: deque = deque(maxlen=capacity)
+        self._active: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._sampler: Optional[_StackSampler] = None
+
+    @property
+    def enabled(self) -> bool:
+        # profiles can only be read back with the token: without it, do not capture any
+        return bool(self.token)
+
+    def authorized(self, token: Optional[str]) -> bool:
+        if not self.token or token is None:
+            return False
+        # constant-time comparison: do not leak the token through timing
+        return hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def should_profile(self, header_token: Optional[str]) -> Optional[str]:
+        """
+        Returns the capture reason ("header" / "sampled") or None.
+        """
+        if not self.enabled:
+            return None
+        if header_token is not None and self.authorized(header_token):
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def _active_snapshot(self) -> List[RequestProfile]:
+        with self._lock:
+            active = list(self._active)
+            if not active:
+                self._sampler = None
+            return active
+
+    def start(self, name: str, reason: str) -> Tuple[RequestProfile, Tuple[Token, Token]]:
+        """
+        Starts a profile and binds it to the current context: tasks created
+        afterwards (ex: the request work task) inherit it.
+        Returns the profile and the context tokens to give back to finish().
+        """
+        prof = RequestProfile(name, reason)
+        tokens = (_current_profile.set(prof), _current_span.set(prof.root))
+        with self._lock:
+            self._active.append(prof)
+            if self._sampler is None:
+                self._sampler = _StackSampler(self)
+                self._sampler.start()
+        return prof, tokens
+
+    def finish(self, prof: RequestProfile, tokens: Optional[Tuple[Token, Token]] = None) -> None:
+        """
+        Stores the profile; `tokens` (from start(), same context) unbind it.
+        """
+        prof.root.end = time.perf_counter()
+        if tokens is not None:
+            profile_token, span_token = tokens
+            _current_span.reset(span_token)
+            _current_profile.reset(profile_token)
+        with self._lock:
+            if prof in self._active:
+                self._active.remove(prof)
+        self.profiles.append(prof)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [p.summary() for p in reversed(self.profiles)]
+
+    def export(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        for p in self.profiles:
+            if p.profile_id == profile_id:
+                with self._lock:
+                    return p.to_dict()
+        return None
@@ -0,0 +1,594 @@
+from __future__ import annotations
+
+from array import array
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import math
+import os
+import xml.etree.ElementTree as ET
+
+from services.routing_ors import OrsRoute
+
+# Default car speeds (km/h) per OSM highway class, used when maxspeed is missing
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 120.0,
+    "motorway_link": 60.0,
+    "trunk": 100.0,
+    "trunk_link": 50.0,
+    "primary": 80.0,
+    "primary_link": 40.0,
+    "secondary": 70.0,
+    "secondary_link": 35.0,
+    "tertiary": 60.0,
+    "tertiary_link": 30.0,
+    "unclassified": 50.0,
+    "residential": 30.0,
+    "living_street": 10.0,
+    "service": 20.0,
+    "road": 40.0,
+}
+
+# Edge flags, one bit per ORS avoid_feature
+FLAG_HIGHWAY = 1
+FLAG_TOLLWAY = 2
+
+AVOID_FEATURE_FLAGS = {
+    "highways": FLAG_HIGHWAY,
+    "tollways": FLAG_TOLLWAY,
+}
+
+METRICS = ("duration", "distance")
+
+INF = float("inf")
+
+
+def _haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    R = 6371000.0
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _parse_maxspeed(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    v = value.strip().lower()
+    factor = 1.0
+    if v.endswith("mph"):
+        factor = 1.609344
+        v = v[:-3].strip()
+    try:
+        speed = float(v) * factor
+    except ValueError:
+        return None
+    return speed if speed > 0 else None
+
+
+class RoadGraph:
+    """
+    Road graph stored as compact arrays (CSR adjacency):
+      - node coordinates in lat/lon arrays
+      - forward and backward edges indexed by first_out offsets
+      - per-edge distance (m), duration (s) and avoid flags
+    """
+
+    GRID_CELL_DEG = 0.01
+
+    def __init__(self, lat: array, lon: array, edges: Dict[str, array]):
+        """
+        edges: parallel arrays "tail", "head", "distance", "duration", "flags".
+        """
+        self.lat = lat
+        self.lon = lon
+        self.num_nodes = len(lat)
+        self.num_edges = len(edges["tail"])
+
+        self.fwd = self._build_csr(edges, reverse=False)
+        self.bwd = self._build_csr(edges, reverse=True)
+
+        # landmark distances: metric -> list of (from_landmark, to_landmark) arrays
+        self.landmarks: List[int] = []
+        self.landmark_dist: Dict[str, List[Tuple[array, array]]] = {m: [] for m in METRICS}
+
+        self._grid: Dict[Tuple[int, int], array] = {}
+        self._build_grid()
+
+    def _build_csr(self, edges: Dict[str, array], reverse: bool) -> Dict[str, array]:
+        n = self.num_nodes
+        m = self.num_edges
+        tails, heads = (edges["head"], edges["tail"]) if reverse else (edges["tail"], edges["head"])
+
+        first_out = array("l", bytes(array("l").itemsize * (n + 1)))
+        for u in tails:
+            first_out[u + 1] += 1
+        for i in range(n):
+            first_out[i + 1] += first_out[i]
+
+        head = array("l", bytes(first_out.itemsize * m))
+        distance = array("d", bytes(8 * m))
+        duration = array("d", bytes(8 * m))
+        flags = array("B", bytes(m))
+
+        pos = first_out[:-1]
+        src_dist, src_dur, src_flags = edges["distance"], edges["duration"], edges["flags"]
+        for e in range(m):
+            tail = tails[e]
+            i = pos[tail]
+            pos[tail] += 1
+            head[i] = heads[e]
+            distance[i] = src_dist[e]
+            duration[i] = src_dur[e]
+            flags[i] = src_flags[e]
+
+        return {"first_out": first_out, "head": head, "distance": distance, "duration": duration, "flags": flags}
+
+    def _build_grid(self) -> None:
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        first_out = self.fwd["first_out"]
+        for i in range(self.num_nodes):
+            # only snap onto nodes we can leave from
+            if first_out[i + 1] == first_out[i]:
+                continue
+            key = self._cell(self.lat[i], self.lon[i])
+            cells.setdefault(key, []).append(i)
+        self._grid = {k: array("l", v) for k, v in cells.items()}
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.GRID_CELL_DEG)), int(math.floor(lon / self.GRID_CELL_DEG))
+
+    @staticmethod
+    def _iter_osm(path: str, tag: str):
+        """
+        Streams the top-level `tag` elements of an OSM XML file, clearing the
+        root after each element so parsed elements do not accumulate in memory.
+        """
+        root = None
+        for event, el in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = el
+                continue
+            if el.tag == tag:
+                yield el
+            if el.tag in ("node", "way", "relation"):
+                root.clear()
+
+    @classmethod
+    def from_osm_xml(cls, path: str) -> "RoadGraph":
+        """
+        Loads drivable ways from an OSM XML extract (.osm) in two passes:
+        ways first (to know which nodes are referenced), then only those nodes.
+        """
+        ways: List[Tuple[array, float, int, int]] = []  # (refs, speed_kmh, oneway, flags)
+        referenced = set()
+
+        for el in cls._iter_osm(path, "way"):
+            tags = {t.get("k"): t.get("v") for t in el.iter("tag")}
+            highway = tags.get("highway")
+            if highway not in HIGHWAY_SPEEDS_KMH or tags.get("access") in ("no", "private"):
+                continue
+
+            refs = array("q", (int(nd.get("ref")) for nd in el.iter("nd")))
+            if len(refs) < 2:
+                continue
+            speed = _parse_maxspeed(tags.get("maxspeed")) or HIGHWAY_SPEEDS_KMH[highway]
+
+            oneway_tag = (tags.get("oneway") or "").lower()
+            if oneway_tag in ("yes", "1", "true"):
+                oneway = 1
+            elif oneway_tag == "-1":
+                oneway = -1
+            elif oneway_tag == "no":
+                oneway = 0
+            elif highway in ("motorway", "motorway_link") or tags.get("junction") == "roundabout":
+                oneway = 1
+            else:
+                oneway = 0
+
+            flags = 0
+            if highway in ("motorway", "motorway_link"):
+                flags |= FLAG_HIGHWAY
+            if (tags.get("toll") or "").lower() == "yes":
+                flags |= FLAG_TOLLWAY
+
+            ways.append((refs, speed, oneway, flags))
+            referenced.update(refs)
+
+        # OSM node id -> compact index, only for nodes used by drivable ways
+        index: Dict[int, int] = {}
+        lat = array("d")
+        lon = array("d")
+        for el in cls._iter_osm(path, "node"):
+            node_id = int(el.get("id"))
+            if node_id in referenced:
+                index[node_id] = len(lat)
+                lat.append(float(el.get("lat")))
+                lon.append(float(el.get("lon")))
+        del referenced
+
+        edges = {
+            "tail": array("l"),
+            "head": array("l"),
+            "distance": array("d"),
+            "duration": array("d"),
+            "flags": array("B"),
+        }
+
+        def add_edge(u: int, v: int, dist_m: float, dur_s: float, fl: int) -> None:
+            edges["tail"].append(u)
+            edges["head"].append(v)
+            edges["distance"].append(dist_m)
+            edges["duration"].append(dur_s)
+            edges["flags"].append(fl)
+
+        for refs, speed, oneway, flags in ways:
+            speed_ms = speed / 3.6
+            prev: Optional[int] = None
+            for ref in refs:
+                cur = index.get(ref)
+                if cur is None:
+                    # node outside the extract
+                    prev = None
+                    continue
+                if prev is not None and prev != cur:
+                    dist_m = _haversine_m(lat[prev], lon[prev], lat[cur], lon[cur])
+                    dur_s = dist_m / speed_ms
+                    if oneway >= 0:
+                        add_edge(prev, cur, dist_m, dur_s, flags)
+                    if oneway <= 0:
+                        add_edge(cur, prev, dist_m, dur_s, flags)
+                prev = cur
+
+        if not edges["tail"]:
+            raise RuntimeError(f"No drivable ways found in OSM extract: {path}")
+
+        return cls(lat, lon, edges)
+
+    def contains(self, lat: float, lon: float, max_distance_m: float) -> bool:
+        return self.nearest_node(lat, lon, max_distance_m=max_distance_m) is not None
+
+    def nearest_node(self, lat: float, lon: float, max_rings: int = 50, max_distance_m: float = INF) -> Optional[int]:
+        """
+        Closest node we can leave from, or None when none lies within max_distance_m.
+        """
+        if max_distance_m < INF:
+            # rings needed to cover max_distance_m along the narrower (longitude) side of a cell
+            cell_m = self.GRID_CELL_DEG * 111320.0 * max(math.cos(math.radians(lat)), 0.01)
+            max_rings = min(max_rings, int(math.ceil(max_distance_m / cell_m)) + 1)
+        ci, cj = self._cell(lat, lon)
+        best: Optional[int] = None
+        best_d = INF
+        found_ring = -1
+        for ring in range(max_rings + 1):
+            # a node found in ring r can only be beaten by nodes in ring r + 1
+            if found_ring >= 0 and ring > found_ring + 1:
+                break
+            for di in range(-ring, ring + 1):
+                for dj in range(-ring, ring + 1):
+                    if max(abs(di), abs(dj)) != ring:
+                        continue
+                    for i in self._grid.get((ci + di, cj + dj), ()):
+                        d = _haversine_m(lat, lon, self.lat[i], self.lon[i])
+                        if d < best_d:
+                            best_d = d
+                            best = i
+            if best is not None and found_ring < 0:
+                found_ring = ring
+        return best if best_d <= max_distance_m else None
+
+    def _dijkstra(
+        self,
+        source: int,
+        metric: str,
+        reverse: bool,
+        avoid_mask: int = 0,
+        targets: Optional[List[int]] = None,
+    ) -> array:
+        """
+        Single-source distances. With `targets`, stops once all of them are settled:
+        only their entries are then exact.
+        """
+        g = self.bwd if reverse else self.fwd
+        first_out, head, weight, flags = g["first_out"], g["head"], g[metric], g["flags"]
+
+        pending = set(targets) if targets is not None else None
+        dist = array("d", [INF]) * self.num_nodes
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if pending is not None:
+                pending.discard(u)
+                if not pending:
+                    break
+            for e in range(first_out[u], first_out[u + 1]):
+                if flags[e] & avoid_mask:
+                    continue
+                v = head[e]
+                nd = d + weight[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return dist
+
+    def build_landmarks(self, count: int = 8) -> None:
+        """
+        ALT preprocessing: pick landmarks by farthest-point selection and
+        store exact distances from/to each of them for every metric.
+        """
+        if count <= 0 or not self._grid:
+            return
+
+        def farthest(dist: array) -> int:
+            best_i, best_d = -1, -1.0
+            for i, d in enumerate(dist):
+                if best_d < d < INF:
+                    best_i, best_d = i, d
+            return best_i
+
+        start = next(iter(self._grid.values()))[0]
+        min_dist = self._dijkstra(start, "distance", reverse=False)
+        candidate = farthest(min_dist)
+
+        selected: List[int] = []
+        # the selection runs are the forward "distance" rows: keep them
+        forward_distance: List[array] = []
+        while len(selected) < count and candidate >= 0 and candidate not in selected:
+            selected.append(candidate)
+            d = self._dijkstra(candidate, "distance", reverse=False)
+            forward_distance.append(d)
+            best_i, best_d = -1, -1.0
+            for i in range(self.num_nodes):
+                if d[i] < min_dist[i]:
+                    min_dist[i] = d[i]
+                m = min_dist[i]
+                if best_d < m < INF:
+                    best_i, best_d = i, m
+            candidate = best_i
+
+        self.landmarks = selected
+        for metric in METRICS:
+            self.landmark_dist[metric] = [
+                (
+                    forward_distance[k] if metric == "distance" else self._dijkstra(lm, metric, reverse=False),
+                    self._dijkstra(lm, metric, reverse=True),
+                )
+                for k, lm in enumerate(selected)
+            ]
+
+    def _heuristic(self, metric: str, v: int, target: int) -> float:
+        # triangle inequality lower bound on dist(v, target);
+        # stays admissible when avoid_features only removes edges
+        best = 0.0
+        for from_lm, to_lm in self.landmark_dist[metric]:
+            a, b = from_lm[target], from_lm[v]
+            if a < INF and b < INF and a - b > best:
+                best = a - b
+            a, b = to_lm[v], to_lm[target]
+            if a < INF and b < INF and a - b > best:
+                best = a - b
+        return best
+
+    def shortest_path(self, source: int, target: int, metric: str, avoid_mask: int = 0) -> Optional[List[int]]:
+        """
+        A* search with ALT landmark bounds. Returns node path or None.
+        """
+        if source == target:
+            return [source]
+
+        g = self.fwd
+        first_out, head, weight, flags = g["first_out"], g["head"], g[metric], g["flags"]
+
+        dist: Dict[int, float] = {source: 0.0}
+        parent: Dict[int, int] = {}
+        heap = [(self._heuristic(metric, source, target), 0.0, source)]
+        h_cache: Dict[int, float] = {}
+
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u == target:
+                path = [u]
+                while u in parent:
+                    u = parent[u]
+                    path.append(u)
+                path.reverse()
+                return path
+            if d > dist.get(u, INF):
+                continue
+            for e in range(first_out[u], first_out[u + 1]):
+                if flags[e] & avoid_mask:
+                    continue
+                v = head[e]
+                nd = d + weight[e]
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    parent[v] = u
+                    h = h_cache.get(v)
+                    if h is None:
+                        h = self._heuristic(metric, v, target)
+                        h_cache[v] = h
+                    heapq.heappush(heap, (nd + h, nd, v))
+        return None
+
+    def path_cost(self, path: List[int], metric: str, avoid_mask: int = 0) -> Tuple[float, float]:
+        """
+        Returns (distance_m, duration_s) along a node path,
+        taking the cheapest allowed parallel edge for each hop.
+        """
+        first_out, head, flags = self.fwd["first_out"], self.fwd["head"], self.fwd["flags"]
+        distance, duration = self.fwd["distance"], self.fwd["duration"]
+        weight = self.fwd[metric]
+        total_m = 0.0
+        total_s = 0.0
+        for u, v in zip(path, path[1:]):
+            best_w, best_m, best_s = INF, INF, INF
+            for e in range(first_out[u], first_out[u + 1]):
+                if head[e] == v and not flags[e] & avoid_mask and weight[e] < best_w:
+                    best_w, best_m, best_s = weight[e], distance[e], duration[e]
+            total_m += best_m
+            total_s += best_s
+        return total_m, total_s
+
+
+class LocalRoutingService:
+    """
+    In-process routing over a local road graph (OSM extract), with the same
+    get_route_with_coords() contract and OrsRoute result as ORSRoutingService.
+    """
+
+    def __init__(
+        self,
+        graph_path: Optional[str] = None,
+        landmarks: Optional[int] = None,
+        snap_radius_m: Optional[float] = None,
+    ):
+        self.graph_path = graph_path or os.getenv("LOCAL_GRAPH_PATH")
+        if not self.graph_path:
+            raise RuntimeError("LOCAL_GRAPH_PATH is missing (env var).")
+        if landmarks is None:
+            landmarks = int(os.getenv("LOCAL_GRAPH_LANDMARKS", "8"))
+        self.landmarks = landmarks
+        # points farther than this from any road of the extract are not routable locally
+        if snap_radius_m is None:
+            snap_radius_m = float(os.getenv("LOCAL_SNAP_RADIUS_M", "300"))
+        self.snap_radius_m = snap_radius_m
+
+        # loaded by load() / start_loading(), not at construction
+        self.graph: Optional[RoadGraph] = None
+        self.load_error: Optional[str] = None
+        self._load_task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.graph is not None
+
+    def load(self) -> None:
+        """
+        Parses the extract and builds landmarks (slow, CPU bound).
+        """
+        graph = RoadGraph.from_osm_xml(self.graph_path)
+        graph.build_landmarks(self.landmarks)
+        self.graph = graph
+
+    def start_loading(self) -> asyncio.Task:
+        """
+        Loads the graph in a worker thread; routing is unavailable until it is ready.
+        """
+        async def run() -> None:
+            try:
+                await asyncio.to_thread(self.load)
+                print("LOCAL ROUTING: graph ready", self.graph.num_nodes, "nodes", self.graph.num_edges, "edges")
+            except Exception as e:
+                self.load_error = f"{type(e).__name__}: {e}"
+                print("LOCAL ROUTING: graph load failed:", self.load_error)
+
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(run())
+        return self._load_task
+
+    def _require_graph(self) -> RoadGraph:
+        if self.graph is None:
+            raise RuntimeError(self.load_error or "local routing graph is still loading.")
+        return self.graph
+
+    def covers(self, coords: List[List[float]]) -> bool:
+        if self.graph is None:
+            return False
+        return all(self.graph.contains(lat, lon, self.snap_radius_m) for lon, lat in coords)
+
+    @staticmethod
+    def _avoid_mask(avoid_features: Optional[List[str]]) -> int:
+        avoid_mask = 0
+        for feat in avoid_features or []:
+            if feat not in AVOID_FEATURE_FLAGS:
+                raise ValueError(f"Unsupported avoid_feature for local routing: {feat}")
+            avoid_mask |= AVOID_FEATURE_FLAGS[feat]
+        return avoid_mask
+
+    def _snap(self, coords: List[List[float]]) -> List[int]:
+        graph = self._require_graph()
+        snapped: List[int] = []
+        for lon, lat in coords:
+            node = graph.nearest_node(lat, lon, max_distance_m=self.snap_radius_m)
+            if node is None:
+                raise RuntimeError(f"No road within {self.snap_radius_m:g} m of ({lat}, {lon}) in local graph.")
+            snapped.append(node)
+        return snapped
+
+    def _route(self, coords: List[List[float]], preference: str, avoid_features: Optional[List[str]]) -> OrsRoute:
+        if len(coords) < 2:
+            raise ValueError("At least 2 coordinates are required.")
+
+        avoid_mask = self._avoid_mask(avoid_features)
+        metric = "distance" if preference == "shortest" else "duration"
+        snapped = self._snap(coords)
+
+        graph = self._require_graph()
+        full_path: List[int] = [snapped[0]]
+        for a, b in zip(snapped, snapped[1:]):
+            leg = graph.shortest_path(a, b, metric, avoid_mask=avoid_mask)
+            if leg is None:
+                raise RuntimeError("Local routing found no path between waypoints.")
+            full_path.extend(leg[1:])
+
+        distance_m, duration_s = graph.path_cost(full_path, metric, avoid_mask=avoid_mask)
+        geometry = {
+            "type": "LineString",
+            "coordinates": [[graph.lon[i], graph.lat[i]] for i in full_path],
+        }
+
+        # mimic the ORS geojson envelope so raw consumers stay engine-agnostic
+        raw = {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": geometry,
+                "properties": {
+                    "summary": {"distance": distance_m, "duration": duration_s},
+                    "engine": "local",
+                },
+            }],
+        }
+
+        return OrsRoute(distance_m=distance_m, duration_s=duration_s, geometry=geometry, raw=raw)
+
+    def _matrix(
+        self,
+        coords: List[List[float]],
+        metric: str,
+        avoid_features: Optional[List[str]],
+    ) -> List[List[Optional[float]]]:
+        if metric not in METRICS:
+            raise ValueError(f"Unsupported matrix metric: {metric}")
+        avoid_mask = self._avoid_mask(avoid_features)
+        snapped = self._snap(coords)
+        graph = self._require_graph()
+        rows: List[List[Optional[float]]] = []
+        # one Dijkstra per source answers the whole row, stopping once every stop is settled
+        for src in snapped:
+            dist = graph._dijkstra(src, metric, reverse=False, avoid_mask=avoid_mask, targets=snapped)
+            rows.append([dist[dst] if dist[dst] < INF else None for dst in snapped])
+        return rows
+
+    async def get_route_with_coords(
+        self,
+        coords: List[List[float]],
+        preference: str = "fastest",
+        avoid_features: Optional[List[str]] = None,
+    ) -> OrsRoute:
+        # graph search is CPU bound: keep it off the event loop
+        return await asyncio.to_thread(self._route, coords, preference, avoid_features)
+
+    async def get_matrix(
+        self,
+        coords: List[List[float]],
+        metric: str = "duration",
+        avoid_features: Optional[List[str]] = None,
+    ) -> List[List[Optional[float]]]:
+        return await asyncio.to_thread(self._matrix, coords, metric, avoid_features)
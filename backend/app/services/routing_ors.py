@@ -34,6 +34,7 @@ class ORSRoutingService:
         coords: List[List[float]],
         preference: str = "fastest",                   # "fastest" | "shortest" | "recommended"
         avoid_features: Optional[List[str]] = None,    # e.g. ["highways","tollways"]
+        timeout_s: Optional[float] = None,             # overrides self.timeout_s (ex: remaining request budget)
     ) -> OrsRoute:
         url = f"{self.base_url}/v2/directions/driving-car/geojson"
         headers = {"Authorization": self.api_key, "Content-Type": "application/json"}
@@ -48,7 +49,7 @@ class ORSRoutingService:
             # ORS expects a list of strings
             body["options"] = {"avoid_features": sorted(set(avoid_features))}
 
-        async with httpx.AsyncClient(timeout=self.timeout_s) as client:
+        async with httpx.AsyncClient(timeout=timeout_s if timeout_s is not None else self.timeout_s) as client:
             r = await client.post(url, headers=headers, json=body)
             r.raise_for_status()
             data = r.json()
@@ -65,6 +66,33 @@ class ORSRoutingService:
 
         return OrsRoute(distance_m=distance_m, duration_s=duration_s, geometry=geometry, raw=data)
 
+    async def get_matrix(
+        self,
+        coords: List[List[float]],
+        metric: str = "duration",
+        timeout_s: Optional[float] = None,
+    ) -> List[List[Optional[float]]]:
+        """
+        One ORS matrix call: durations (s) or distances (m) between every pair
+        of [lon, lat] points. Unreachable pairs are None.
+        Note: the matrix API has no avoid_features option.
+        """
+        if metric not in ("duration", "distance"):
+            raise ValueError(f"Unsupported matrix metric: {metric}")
+        url = f"{self.base_url}/v2/matrix/driving-car"
+        headers = {"Authorization": self.api_key, "Content-Type": "application/json"}
+        body = {"locations": coords, "metrics": [metric]}
+
+        async with httpx.AsyncClient(timeout=timeout_s if timeout_s is not None else self.timeout_s) as client:
+            r = await client.post(url, headers=headers, json=body)
+            r.raise_for_status()
+            data = r.json()
+
+        rows = data.get(f"{metric}s")
+        if not isinstance(rows, list) or len(rows) != len(coords):
+            raise RuntimeError(f"ORS matrix response has no {metric}s.")
+        return rows
+
     async def get_route(
         self,
         origin_lon: float,
@@ -73,6 +101,9 @@ class ORSRoutingService:
         dest_lat: float,
         preference: str = "fastest",
         avoid_features: Optional[List[str]] = None,
+        timeout_s: Optional[float] = None,
     ) -> OrsRoute:
         coords = [[origin_lon, origin_lat], [dest_lon, dest_lat]]
-        return await self.get_route_with_coords(coords, preference=preference, avoid_features=avoid_features)
\ No newline at end of file
+        return await self.get_route_with_coords(
+            coords, preference=preference, avoid_features=avoid_features, timeout_s=timeout_s
+        )
\ No newline at end of file
@@ -1,40 +1,218 @@
 from __future__ import annotations
 
+from array import array
 from dataclasses import dataclass
-from typing import Any, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import codecs
+import json
 import os
+import re
 import httpx
 
 
+class IncidentTable:
+    """
+    Compact column storage of classified incidents (one slot per incident):
+    icon category, magnitude of delay, closure flag and geometry bbox.
+    """
+
+    __slots__ = ("icon_category", "delay", "closure", "min_lon", "min_lat", "max_lon", "max_lat")
+
+    def __init__(self):
+        self.icon_category = array("b")
+        self.delay = array("b")
+        self.closure = array("b")
+        self.min_lon = array("d")
+        self.min_lat = array("d")
+        self.max_lon = array("d")
+        self.max_lat = array("d")
+
+    def __len__(self) -> int:
+        return len(self.delay)
+
+    def append(self, icon_category: int, delay: int, closure: bool, bbox: Optional[Tuple[float, float, float, float]]) -> None:
+        self.icon_category.append(icon_category)
+        self.delay.append(delay)
+        self.closure.append(1 if closure else 0)
+        min_lon, min_lat, max_lon, max_lat = bbox or (float("nan"),) * 4
+        self.min_lon.append(min_lon)
+        self.min_lat.append(min_lat)
+        self.max_lon.append(max_lon)
+        self.max_lat.append(max_lat)
+
+    def count(self, min_delay: int = 0, closure_only: bool = False) -> int:
+        return sum(
+            1 for d, c in zip(self.delay, self.closure)
+            if d >= min_delay and (c or not closure_only)
+        )
+
+
 @dataclass(frozen=True)
 class TomTomTrafficResult:
     scenarios: List[str]
-    raw: Any
+    raw: Any                                # only kept when keep_raw=True
     error: Optional[str] = None
     endpoint: Optional[str] = None
+    incidents: Optional[IncidentTable] = None
+    complete: bool = True                   # False when parsing stopped early
+
+
+def _geometry_bbox(geometry: Any) -> Optional[Tuple[float, float, float, float]]:
+    coords = (geometry or {}).get("coordinates")
+    if not coords:
+        return None
+    # Point: [lon, lat], LineString: [[lon, lat], ...]
+    points = [coords] if isinstance(coords[0], (int, float)) else coords
+    lons = [p[0] for p in points]
+    lats = [p[1] for p in points]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+# structural characters outside strings, and characters that matter inside them
+_STRUCTURAL = re.compile(r'["{}\[\],]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+async def _iter_array_items(chunks: AsyncIterator[bytes], key: str) -> AsyncIterator[Any]:
+    """
+    Incrementally yields the items of the top-level `key` array of a JSON
+    document. Nesting depth and string/escape state are tracked as chunks
+    arrive, so each item is decoded exactly once, when it closes.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    marker = f'"{key}"'
+
+    async def texts() -> AsyncIterator[str]:
+        async for chunk in chunks:
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    parts: List[str] = []   # pieces of the current item, across chunks
+    depth = 0
+    in_string = False
+    escape = False
+
+    def scan(text: str) -> Tuple[List[Any], bool]:
+        """
+        Returns the items completed in `text` and whether the array ended.
+        """
+        nonlocal depth, in_string, escape
+        items: List[Any] = []
+        start = 0
+        i = 0
+        if escape and text:
+            escape = False
+            i = 1
+        while i < len(text):
+            if in_string:
+                m = _STRING_SPECIAL.search(text, i)
+                if m is None:
+                    break
+                i = m.end()
+                if m.group() == "\\":
+                    if i >= len(text):
+                        escape = True
+                        break
+                    i += 1
+                else:
+                    in_string = False
+                continue
+
+            m = _STRUCTURAL.search(text, i)
+            if m is None:
+                break
+            ch = m.group()
+            i = m.end()
+            if ch == '"':
+                in_string = True
+            elif ch in "{[":
+                depth += 1
+            elif depth > 0 and ch in "}]":
+                depth -= 1
+                if depth == 0:
+                    # an object/array item just closed
+                    parts.append(text[start:i])
+                    items.append(json.loads("".join(parts)))
+                    parts.clear()
+                    start = i
+            elif depth > 0:
+                # separator inside an item
+                continue
+            elif ch in ",]":
+                # separator or end of the array: flush a pending scalar item
+                parts.append(text[start:i - 1])
+                item = "".join(parts).strip()
+                parts.clear()
+                start = i
+                if item:
+                    items.append(json.loads(item))
+                if ch == "]":
+                    return items, True
+            else:
+                raise ValueError(f"Malformed JSON array '{key}'.")
+        parts.append(text[start:])
+        return items, False
+
+    stream = texts()
+
+    # find the start of the array
+    buf = ""
+    async for text in stream:
+        buf += text
+        i = buf.find(marker)
+        j = buf.find("[", i + len(marker)) if i >= 0 else -1
+        if j >= 0:
+            break
+        if i < 0:
+            buf = buf[-len(marker):]
+    else:
+        return
+
+    items, done = scan(buf[j + 1:])
+    while True:
+        for item in items:
+            yield item
+        if done:
+            return
+        try:
+            text = await stream.__anext__()
+        except StopAsyncIteration:
+            raise ValueError(f"Truncated JSON array '{key}'.")
+        items, done = scan(text)
 
 
 class TomTomTrafficService:
-    def __init__(self, api_key: Optional[str] = None, timeout_s: float = 12.0):
+    def __init__(self, api_key: Optional[str] = None, timeout_s: float = 12.0, keep_raw: Optional[bool] = None):
         self.api_key = api_key or os.getenv("TOMTOM_API_KEY")
         if not self.api_key:
             raise RuntimeError("TOMTOM_API_KEY is missing (env var).")
         self.timeout_s = timeout_s
         self.base_url = "https://api.tomtom.com"
+        if keep_raw is None:
+            keep_raw = os.getenv("TOMTOM_KEEP_RAW", "0") == "1"
+        self.keep_raw = keep_raw
 
     async def incidents_bbox(
         self,
         min_lat: float,
         min_lon: float,
         max_lat: float,
-        max_lon: float
+        max_lon: float,
+        timeout_s: Optional[float] = None,
+        early_exit: bool = True,
     ) -> TomTomTrafficResult:
+        """
+        Streams the incidents response and classifies it item by item.
+        early_exit: stop reading once every scenario is known (a road closure
+        implies traffic_heavy), leaving `incidents` partial.
+        """
         url = f"{self.base_url}/traffic/services/5/incidentDetails"
 
         #west,south,east,north (lon,lat,lon,lat)
         bbox = f"{min_lon},{min_lat},{max_lon},{max_lat}"
 
-        fields = "{incidents{type,geometry{type,coordinates},properties{iconCategory,magnitudeOfDelay,roadNumbers,events{description}}}}"
+        # coordinates are only read to compute each incident's bbox (the API has no bbox field)
+        fields = "{incidents{geometry{coordinates},properties{iconCategory,magnitudeOfDelay,roadNumbers,events{description}}}}"
 
         params = {
             "key": self.api_key,
@@ -44,11 +222,45 @@ class TomTomTrafficService:
             "timeValidityFilter": "present",
         }
 
+        table = IncidentTable()
+        raw_incidents: Optional[List[Dict[str, Any]]] = [] if self.keep_raw else None
+        significant_detected = False
+        road_closure_detected = False
+        complete = True
+
         try:
-            async with httpx.AsyncClient(timeout=self.timeout_s) as client:
-                r = await client.get(url, params=params)
-                r.raise_for_status()
-                data = r.json()
+            async with httpx.AsyncClient(timeout=timeout_s if timeout_s is not None else self.timeout_s) as client:
+                async with client.stream("GET", url, params=params) as r:
+                    r.raise_for_status()
+
+                    async for inc in _iter_array_items(r.aiter_bytes(), "incidents"):
+                        props = inc.get("properties") or {}
+                        delay = props.get("magnitudeOfDelay") or 0
+
+                        closure = False
+                        if delay >= 3:
+                            significant_detected = True
+                            # descriptions only matter for significant incidents
+                            for ev in props.get("events") or []:
+                                desc = (ev.get("description") or "").lower()
+                                if "road closed" in desc or "full closure" in desc:
+                                    closure = True
+                                    break
+
+                        table.append(
+                            int(props.get("iconCategory") or 0),
+                            int(delay),
+                            closure,
+                            _geometry_bbox(inc.get("geometry")),
+                        )
+                        if raw_incidents is not None:
+                            raw_incidents.append(inc)
+
+                        if closure:
+                            road_closure_detected = True
+                            if early_exit:
+                                complete = False
+                                break
         except Exception as e:
             return TomTomTrafficResult(
                 scenarios=[],
@@ -58,49 +270,16 @@ class TomTomTrafficService:
             )
 
         scenarios: List[str] = []
-        incidents = (data.get("incidents") or [])
-
-        significant_incidents = []
-        road_closure_detected = False
-
-        for inc in incidents:
-            props = inc.get("properties") or {}
-
-            delay = props.get("magnitudeOfDelay", 0)
-            events = props.get("events") or []
-
-            if delay >= 3:
-                significant_incidents.append(inc)
-
-            for ev in events:
-                desc = (ev.get("description") or "").lower()
-
-                if (
-                        ("road closed" in desc or "full closure" in desc)
-                        and delay >= 3
-                ):
-                    road_closure_detected = True
-                    break
-
-            if road_closure_detected:
-                break
-
-        if significant_incidents:
+        if significant_detected:
             scenarios.append("traffic_heavy")
-
         if road_closure_detected:
             scenarios.append("road_closure")
 
-        out: List[str] = []
-        seen = set()
-        for s in scenarios:
-            if s not in seen:
-                seen.add(s)
-                out.append(s)
-
         return TomTomTrafficResult(
-            scenarios=out,
-            raw=data,
+            scenarios=scenarios,
+            raw={"incidents": raw_incidents} if raw_incidents is not None else None,
             error=None,
             endpoint=str(r.url),
-        )
\ No newline at end of file
+            incidents=table,
+            complete=complete,
+        )
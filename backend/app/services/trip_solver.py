@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from array import array
+from typing import List, Optional, Tuple
+import math
+
+# stands in for unreachable pairs so that move deltas stay finite
+UNREACHABLE_COST = 1e9
+
+
+class CostMatrix:
+    """
+    Square (possibly asymmetric) cost matrix flattened into one array.
+    """
+
+    __slots__ = ("n", "data")
+
+    def __init__(self, rows: List[List[Optional[float]]]):
+        self.n = len(rows)
+        self.data = array("d", bytes(8 * self.n * self.n))
+        for i, row in enumerate(rows):
+            if len(row) != self.n:
+                raise ValueError("Cost matrix must be square.")
+            for j, v in enumerate(row):
+                ok = v is not None and math.isfinite(v)
+                self.data[i * self.n + j] = float(v) if ok else UNREACHABLE_COST
+
+    def cost(self, a: int, b: Optional[int]) -> float:
+        # b is None past the end of an open path
+        if b is None:
+            return 0.0
+        return self.data[a * self.n + b]
+
+    def path_cost(self, tour: List[int]) -> float:
+        return sum(self.cost(a, b) for a, b in zip(tour, tour[1:]))
+
+
+def unreachable_legs(rows: List[List[Optional[float]]], tour: List[int]) -> List[Tuple[int, int]]:
+    """
+    Consecutive (from, to) pairs of `tour` with no finite cost in the input matrix.
+    """
+    bad = []
+    for a, b in zip(tour, tour[1:]):
+        v = rows[a][b]
+        if v is None or not math.isfinite(v):
+            bad.append((a, b))
+    return bad
+
+
+def nearest_neighbour(m: CostMatrix, start: int, free: List[int]) -> List[int]:
+    tour = [start]
+    left = set(free)
+    cur = start
+    while left:
+        nxt = min(left, key=lambda j: (m.cost(cur, j), j))
+        tour.append(nxt)
+        left.remove(nxt)
+        cur = nxt
+    return tour
+
+
+def _prefix_costs(m: CostMatrix, tour: List[int]) -> Tuple[List[float], List[float]]:
+    """
+    fwd[k] = cost of tour[0] -> ... -> tour[k]
+    rev[k] = cost of the same edges walked backwards (tour[k] -> ... -> tour[0])
+    """
+    fwd = [0.0] * len(tour)
+    rev = [0.0] * len(tour)
+    for k in range(1, len(tour)):
+        fwd[k] = fwd[k - 1] + m.cost(tour[k - 1], tour[k])
+        rev[k] = rev[k - 1] + m.cost(tour[k], tour[k - 1])
+    return fwd, rev
+
+
+def two_opt(m: CostMatrix, tour: List[int], fixed_end: bool) -> bool:
+    """
+    One pass of first-improvement 2-opt (segment reversal).
+    tour[0] never moves, nor tour[-1] when fixed_end. Works for asymmetric costs.
+    """
+    n = len(tour)
+    last = n - 2 if fixed_end else n - 1
+    fwd, rev = _prefix_costs(m, tour)
+    for i in range(1, last):
+        a = tour[i - 1]
+        for j in range(i + 1, last + 1):
+            b = tour[j + 1] if j + 1 < n else None
+            old = m.cost(a, tour[i]) + (fwd[j] - fwd[i]) + m.cost(tour[j], b)
+            new = m.cost(a, tour[j]) + (rev[j] - rev[i]) + m.cost(tour[i], b)
+            if new < old - 1e-9:
+                tour[i:j + 1] = tour[i:j + 1][::-1]
+                return True
+    return False
+
+
+def or_opt(m: CostMatrix, tour: List[int], fixed_end: bool, max_len: int = 3) -> bool:
+    """
+    One pass of first-improvement or-opt: move a chain of 1..max_len stops
+    (same orientation) between two other consecutive stops.
+    """
+    n = len(tour)
+    last = n - 2 if fixed_end else n - 1
+    for seg_len in range(1, max_len + 1):
+        for i in range(1, last - seg_len + 2):
+            j = i + seg_len - 1
+            p = tour[i - 1]
+            q = tour[j + 1] if j + 1 < n else None
+            s0, s1 = tour[i], tour[j]
+            removed = m.cost(p, s0) + m.cost(s1, q) - m.cost(p, q)
+
+            for k in range(0, n - 1 if fixed_end else n):
+                if i - 1 <= k <= j:
+                    continue
+                x = tour[k]
+                y = tour[k + 1] if k + 1 < n else None
+                added = m.cost(x, s0) + m.cost(s1, y) - m.cost(x, y)
+                if added < removed - 1e-9:
+                    seg = tour[i:j + 1]
+                    rest = tour[:i] + tour[j + 1:]
+                    pos = rest.index(x) + 1
+                    tour[:] = rest[:pos] + seg + rest[pos:]
+                    return True
+    return False
+
+
+def solve_order(
+    rows: List[List[Optional[float]]],
+    start: int = 0,
+    end: Optional[int] = None,
+    round_trip: bool = False,
+    max_moves: int = 10000,
+) -> Tuple[List[int], float]:
+    """
+    Orders stops with nearest neighbour then 2-opt / or-opt local search.
+      - start: index of the fixed first stop
+      - end: index of a fixed last stop (ignored when round_trip)
+      - round_trip: come back to start at the end
+    Returns (visit order as matrix indices, estimated cost). For round trips
+    the order does not repeat the start at the end; the cost includes the way back.
+    """
+    m = CostMatrix(rows)
+    if m.n == 0:
+        return [], 0.0
+    if not 0 <= start < m.n or (end is not None and not 0 <= end < m.n):
+        raise ValueError("start/end out of range.")
+    if end == start:
+        round_trip = True
+    if round_trip:
+        end = None
+
+    free = [i for i in range(m.n) if i != start and i != end]
+    tour = nearest_neighbour(m, start, free)
+    fixed_end = round_trip or end is not None
+    if round_trip:
+        tour.append(start)
+    elif end is not None and end != start:
+        tour.append(end)
+
+    moves = 0
+    while moves < max_moves and (two_opt(m, tour, fixed_end) or or_opt(m, tour, fixed_end)):
+        moves += 1
+
+    cost = m.path_cost(tour)
+    if round_trip:
+        tour = tour[:-1]
+    return tour, cost
@@ -24,11 +24,14 @@ class WeatherService:
             raise RuntimeError("OPENWEATHER_API_KEY is missing (env var).")
         self.timeout_s = timeout_s
 
-    async def get_scenarios(self, lat: float, lon: float) -> WeatherContext:
+    async def get_scenarios(self, lat: float, lon: float, timeout_s: Optional[float] = None) -> WeatherContext:
+        """
+        timeout_s: overrides the default timeout (ex: remaining request budget).
+        """
         url = "https://api.openweathermap.org/data/2.5/weather"
         params = {"lat": lat, "lon": lon, "appid": self.api_key}
 
-        async with httpx.AsyncClient(timeout=self.timeout_s) as client:
+        async with httpx.AsyncClient(timeout=timeout_s if timeout_s is not None else self.timeout_s) as client:
             r = await client.get(url, params=params)
             r.raise_for_status()
             data = r.json()
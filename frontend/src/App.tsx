@@ -107,7 +107,8 @@ export default function App() {
 
     setLoadingPlan(true);
     try {
-      const data = await planRoute(effectiveReq);
+      // réutilise le snapshot de /context (ignoré par le backend si la requête a changé)
+      const data = await planRoute({ ...effectiveReq, snapshot_id: context?.snapshot_id ?? null });
       setPlan(data);
     } catch (e: any) {
       setError(e?.message ?? "Erreur /plan");
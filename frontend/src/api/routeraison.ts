@@ -1,4 +1,11 @@
-import type { ContextResponse, PlanRequest, PlanResponse } from "../types/routeraison";
+import type {
+  ContextResponse,
+  GeocodeResponse,
+  PlanRequest,
+  PlanResponse,
+  TripRequest,
+  TripResponse,
+} from "../types/routeraison";
 import { getJSON, postJSON } from "./client";
 
 export function health() {
@@ -11,4 +18,13 @@ export function fetchContext(req: PlanRequest) {
 
 export function planRoute(req: PlanRequest) {
   return postJSON<PlanResponse>("/plan", req);
-}
\ No newline at end of file
+}
+
+export function geocode(q: string, limit = 5) {
+  const params = new URLSearchParams({ q, limit: String(limit) });
+  return getJSON<GeocodeResponse>(`/geocode?${params.toString()}`);
+}
+
+export function optimizeTrip(req: TripRequest) {
+  return postJSON<TripResponse>("/trip/optimize", req);
+}
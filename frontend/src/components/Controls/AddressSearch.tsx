@@ -1,11 +1,6 @@
 import { useState } from "react";
-import type { LatLon } from "../../types/routeraison";
-
-type NominatimItem = {
-  display_name: string;
-  lat: string;
-  lon: string;
-};
+import type { GeocodeItem, LatLon } from "../../types/routeraison";
+import { geocode } from "../../api/routeraison";
 
 export function AddressSearch(props: {
   label: string;
@@ -14,7 +9,7 @@ export function AddressSearch(props: {
 }) {
   const [q, setQ] = useState("");
   const [loading, setLoading] = useState(false);
-  const [results, setResults] = useState<NominatimItem[]>([]);
+  const [results, setResults] = useState<GeocodeItem[]>([]);
   const [error, setError] = useState<string | null>(null);
 
   async function search() {
@@ -26,19 +21,9 @@ export function AddressSearch(props: {
     setResults([]);
 
     try {
-      const url = new URL("https://nominatim.openstreetmap.org/search");
-      url.searchParams.set("format", "json");
-      url.searchParams.set("q", query);
-      url.searchParams.set("limit", "5");
-
-      const res = await fetch(url.toString(), {
-        headers: {
-          "Accept": "application/json",
-        },
-      });
-      if (!res.ok) throw new Error(`Nominatim HTTP ${res.status}`);
-      const data = (await res.json()) as NominatimItem[];
-      setResults(data);
+      // passe par le backend (cache + limitation des appels Nominatim)
+      const data = await geocode(query, 5);
+      setResults(data.results);
     } catch (e: any) {
       setError(e?.message ?? "Erreur de géocodage");
     } finally {
@@ -46,8 +31,8 @@ export function AddressSearch(props: {
     }
   }
 
-  function pick(item: NominatimItem) {
-    props.onSelect({ lat: parseFloat(item.lat), lon: parseFloat(item.lon) });
+  function pick(item: GeocodeItem) {
+    props.onSelect({ lat: item.lat, lon: item.lon });
     setResults([]);
   }
 
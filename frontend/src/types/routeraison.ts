@@ -32,11 +32,18 @@ export type PlanRequest = {
   short_city_trip?: boolean | null;
 
   forced_option?: RouteOption | null;
+
+  routing_engine?: "ors" | "local" | "auto" | null;
+
+  snapshot_id?: string | null;
+
+  track?: boolean;
 };
 
 export type ContextResponse = {
   scenarios: string[];
   debug?: Record<string, any> | null;
+  snapshot_id?: string | null;
 };
 
 export type PlanResponse = {
@@ -53,7 +60,46 @@ export type PlanResponse = {
       preference: string;
     };
     debug_station?: { name: string; lat: number; lon: number } | null;
+    debug_engine?: "ors" | "local";
+    debug_reused?: string[];
   };
   ai_raison_raw: any;
   ai_raison_explanations?: Record<string, string[]> | null;
+  session_id?: string | null;
+};
+
+export type GeocodeItem = {
+  display_name: string;
+  lat: number;
+  lon: number;
+};
+
+export type GeocodeResponse = {
+  results: GeocodeItem[];
+  source: "cache" | "prefix" | "upstream";
+};
+
+export type TripRequest = {
+  stops: LatLon[];
+  round_trip?: boolean;
+  keep_last?: boolean;
+  preference?: "fastest" | "shortest" | "recommended";
+  avoid_features?: ("highways" | "tollways")[];
+  routing_engine?: "ors" | "local" | "auto" | null;
+};
+
+export type TripResponse = {
+  order: number[];
+  stops: LatLon[];
+  matrix_metric: "duration" | "distance";
+  estimated_duration_s?: number | null;
+  estimated_distance_m?: number | null;
+  route: {
+    distance_m: number;
+    duration_s: number;
+    geometry: Geometry;
+    debug_engine?: "ors" | "local";
+    debug_matrix_engine?: "ors" | "local";
+  };
+  warnings?: string[];
 };